@@ -1,4 +1,8 @@
-import requests
+import sys
+from geolocation import DEFAULT_URL, LocationProvider
 
-response = requests.get("http://ip-api.com/json/")
-print(response.json())
+# the fix is cached in .location.json, so a rerun within the TTL makes no request.
+# Pass another url (e.g. fake_geo_server.py) to test without the network
+location = LocationProvider(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_URL)
+print(location.wait(timeout=10.0))
+location.close()
@@ -1,13 +1,19 @@
-import torch
-import whisper
-import deepspeed
+import os, sys
 import sounddevice as sd
 import scipy.io.wavfile as wav
-import pyttsx3  # Import pyttsx3 for text-to-speech
-
-# Load Whisper model with DeepSpeed optimization
-model = whisper.load_model("base")
-ds_model = deepspeed.init_inference(model, dtype=torch.float32)
+from stream_stt import MicrophoneSource, stream_transcribe
+from stt_backends import load_backend
+from stt_server import STTClient
+from tts_cache import SpeechCache
+
+# Use the warm transcription server (stt_server.py) when it is running,
+# otherwise load Whisper model here.
+# STT_BACKEND=whisper|deepspeed|int8 picks another backend (see stt_backends.py)
+stt = STTClient()
+if stt.available():
+    model = stt
+else:
+    model = load_backend(os.environ.get("STT_BACKEND", "whisper"), "base")
 
 # Function to record audio
 def record_audio(filename, duration=5, samplerate=16000):
@@ -24,24 +30,28 @@ def speech_to_text(audio_file):
     print("📝 Recognized Text:", result["text"])
     return result["text"]
 
+# Synthesized phrases are cached (memory + .tts_cache on disk) and played from memory
+speech = SpeechCache(cache_dir=".tts_cache", driver="espeak")
+
 # Function to convert text to speech using pyttsx3
 def text_to_speech(text):
     print("🎙️ Generating speech...")
-    engine = pyttsx3.init(driverName='espeak')  # Initialize pyttsx3 engine
-    engine.save_to_file(text, "output.wav")  # Save speech to file
-    engine.runAndWait()  # Run the speech engine
-    print("✅ Speech saved to 'output.wav'")
-    
-    # Play the audio
-    import os
-    os.system("play output.wav")
-
-
+    speech.speak(text)
+    print("✅ Done speaking!")
 
 # Run the program
 if __name__ == "__main__":
-    audio_file = "input.wav"
-    record_audio(audio_file, duration=5)
-    text = speech_to_text(audio_file)
-    text_to_speech(text)
+    if "--stream" in sys.argv:
+        # Keep listening, each utterance is transcribed straight from memory
+        for event in stream_transcribe(model, MicrophoneSource()):
+            if not event["text"]:
+                continue
+            print("📝 {} ({:.0f} ms to first text): {}".format(event["type"], event["ttft_ms"], event["text"]))
+            if event["type"] == "final":
+                text_to_speech(event["text"])
+    else:
+        audio_file = "input.wav"
+        record_audio(audio_file, duration=5)
+        text = speech_to_text(audio_file)
+        text_to_speech(text)
 
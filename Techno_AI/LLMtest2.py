@@ -1,11 +1,16 @@
-import torch
-import whisper
+import os, sys
 import sounddevice as sd
 import scipy.io.wavfile as wav
-import pyttsx3  
+from stream_stt import MicrophoneSource, stream_transcribe
+from stt_backends import load_backend
+from stt_server import STTClient
+from tts_cache import SpeechCache
 
-# Load Whisper model
-model = whisper.load_model("base")
+# Use the warm transcription server (stt_server.py) when it is running,
+# otherwise load Whisper model here.
+# STT_BACKEND=whisper|deepspeed|int8 picks another backend (see stt_backends.py)
+stt = STTClient()
+model = stt if stt.available() else load_backend(os.environ.get("STT_BACKEND", "whisper"), "base")
 
 # Record audio function
 def record_audio(filename, duration=5, samplerate=16000):
@@ -22,18 +27,28 @@ def speech_to_text(audio_file):
     print("📝 Recognized Text:", result["text"])
     return result["text"]
 
+# Synthesized phrases are cached (memory + .tts_cache on disk) and played from memory
+speech = SpeechCache(cache_dir=".tts_cache")
+
 # Text-to-speech using pyttsx3
 def text_to_speech(text):
     print("🎙️ Generating speech...")
-    engine = pyttsx3.init()  # Initialize pyttsx3 engine
-    engine.say(text)  # Speak the text
-    engine.runAndWait()  # Run the speech engine
+    speech.speak(text)
     print("✅ Done speaking!")
 
 # Run the program
 if __name__ == "__main__":
-    audio_file = "input.wav"
-    record_audio(audio_file, duration=5)
-    text = speech_to_text(audio_file)
-    text_to_speech(text)
+    if "--stream" in sys.argv:
+        # Keep listening, each utterance is transcribed straight from memory
+        for event in stream_transcribe(model, MicrophoneSource()):
+            if not event["text"]:
+                continue
+            print("📝 {} ({:.0f} ms to first text): {}".format(event["type"], event["ttft_ms"], event["text"]))
+            if event["type"] == "final":
+                text_to_speech(event["text"])
+    else:
+        audio_file = "input.wav"
+        record_audio(audio_file, duration=5)
+        text = speech_to_text(audio_file)
+        text_to_speech(text)
 
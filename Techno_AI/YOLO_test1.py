@@ -1,68 +1,40 @@
-import cv2
+import sys
 from ultralytics import YOLO
+from detections import Detections
+from event_log import DetectionLog
+from mjpeg import open_source
+from pipeline import FramePipeline
+from scene_gate import SceneChangeGate
 
 # Load the model
 yolo = YOLO('yolov8s.pt')
 
-# Load the video capture
-videoCap = cv2.VideoCapture(0)
-
-# Function to get class colors
-def getColours(cls_num):
-    base_colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
-    color_index = cls_num % len(base_colors)
-    increments = [(1, -2, 1), (-2, 1, -1), (1, -1, 2)]
-    color = [base_colors[color_index][i] + increments[color_index][i] * 
-    (cls_num // len(base_colors)) % 256 for i in range(3)]
-    return tuple(color)
-
-
-while True:
-    ret, frame = videoCap.read()
-    if not ret:
-        continue
-
-    frame = cv2.resize(frame, (600,400))
-
-    results = yolo.track(frame, stream=True)
-
-
-    for result in results:
-        # get the classes names
-        classes_names = result.names
-
-        # iterate over each box
-        for box in result.boxes:
-            # check if confidence is greater than 40 percent
-            if box.conf[0] > 0.4:
-                # get coordinates
-                [x1, y1, x2, y2] = box.xyxy[0]
-                # convert to int
-                x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-
-                # get the class
-                cls = int(box.cls[0])
-
-                # get the class name
-                class_name = classes_names[cls]
-
-                # get the respective colour
-                colour = getColours(cls)
-
-                # draw the rectangle
-                cv2.rectangle(frame, (x1, y1), (x2, y2), colour, 2)
-
-                # put the class name and confidence on the image
-                cv2.putText(frame, f'{classes_names[int(box.cls[0])]} {box.conf[0]:.2f}', (x1, y1), cv2.FONT_HERSHEY_SIMPLEX, 1, colour, 2)
-                
-    # show the image
-    cv2.imshow('frame', frame)
-
-    # break the loop if 'q' is pressed
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-
-# release the video capture and destroy all windows
-videoCap.release()
-cv2.destroyAllWindows()
-
+# skip inference on frames where nothing changed and reuse the last boxes
+gate = SceneChangeGate(threshold=4.0, max_skip=15)
+
+# every detection is kept in detections/*.parquet, see event_log.query_detections
+events = DetectionLog('detections')
+stream_name = sys.argv[1] if len(sys.argv) > 1 else '0'
+
+# runs on the inference thread
+@gate.wrap
+def infer(frame):
+    # one copy of the boxes to numpy per frame, shared by drawing and logging
+    detections = Detections.from_ultralytics(yolo.track(frame))
+    events.log_detections(detections, stream_name)
+    return detections
+
+# runs on the display thread
+def render(frame, detections):
+    # only boxes with confidence over 40 percent, colours come from a precomputed palette
+    return detections.above(0.4).draw(frame, label='{name} {confidence:.2f}')
+
+if __name__ == "__main__":
+    # webcam by default, or a camera index / video file / ESP32 stream url
+    source = open_source(sys.argv[1] if len(sys.argv) > 1 else 0)
+    # capture, inference and display run on their own threads, press 'q' to quit
+    pipeline = FramePipeline(source, infer, render, resize=(600, 400))
+    print(pipeline.run())
+    print(gate.summary())
+    events.close()
+    print(events.summary())
@@ -1,6 +1,6 @@
 import numpy as np
 import pandas as pd
-import cv2, os, glob
+import cv2, os, glob, hashlib, shutil, time
 import xml.etree.ElementTree as ET
 import matplotlib.pyplot as plt
 import tensorflow as tf
@@ -32,6 +32,9 @@ yolo_anchors = np.array([
 
 yolo_anchor_masks = np.array([[6, 7, 8], [3, 4, 5], [0, 1, 2]])
 
+# epsilon of tf.keras.layers.BatchNormalization, i.e. of the unfused model
+BN_EPSILON = 1e-3
+
 class_names = [
     'person', 'bicycle','car','motorbike','aeroplane','bus','train','truck','boat',
     'traffic light','fire hydrant','stop sign','parking meter','bench',
@@ -47,41 +50,128 @@ class_names = [
     'hair drier','toothbrush'
 ]
 
-def load_darknet_weights(model, weights_file):
-    wf = open(weights_file, 'rb')
-    major, minor, revision, seen, _ = np.fromfile(wf, dtype=np.int32, count=5)
-    
-    layers = YOLOV3_LAYER_LIST  # List of layers as defined in your code
-    
-    for layer_name in layers:
+def _darknet_convs(model):
+    '''yields (key, conv, batch_norm, has_bn) in the order the Darknet weights file
+    stores them. has_bn is also set for fused convs (followed directly by the
+    LeakyReLU), whose batch norm gets folded into the conv on load'''
+    for layer_name in YOLOV3_LAYER_LIST:
         sub_model = model.get_layer(layer_name)
+        n = 0
         for i, layer in enumerate(sub_model.layers):
             if not layer.name.startswith('conv2d'):
                 continue
             batch_norm = None
-            if i + 1 < len(sub_model.layers) and sub_model.layers[i + 1].name.startswith('batch_norm'):
-                batch_norm = sub_model.layers[i + 1]
-            filters = layer.filters
-            size = layer.kernel_size[0]
-            in_dim = layer.input.shape[-1]  # Use layer.input.shape for input dimension
-            if batch_norm is None:
-                conv_bias = np.fromfile(wf, dtype=np.float32, count=filters)
-            else:
-                bn_weights = np.fromfile(wf, dtype=np.float32, count=4 * filters)
-                bn_weights = bn_weights.reshape((4, filters))[[1, 0, 2, 3]]
-                
-            conv_shape = (filters, in_dim, size, size)
-            conv_weights = np.fromfile(wf, dtype=np.float32, count=np.product(conv_shape))
-            conv_weights = conv_weights.reshape(conv_shape).transpose([2, 3, 1, 0])
-            
-            if batch_norm is None:
-                layer.set_weights([conv_weights, conv_bias])
+            has_bn = False
+            if i + 1 < len(sub_model.layers):
+                next_layer = sub_model.layers[i + 1]
+                if next_layer.name.startswith('batch_norm'):
+                    batch_norm = next_layer
+                has_bn = batch_norm is not None or isinstance(next_layer, LeakyReLU)
+            yield '{}/{}'.format(layer_name, n), layer, batch_norm, has_bn
+            n += 1
+
+def fold_batch_norm(conv_weights, bn_weights, epsilon=BN_EPSILON):
+    '''returns the kernel and bias of a conv that equals conv -> batch norm (inference)'''
+    gamma, beta, mean, variance = bn_weights
+    scale = gamma / np.sqrt(variance + epsilon)
+    return conv_weights * scale, beta - mean * scale
+
+def _set_conv_weights(layer, batch_norm, conv_weights, conv_bias=None, bn_weights=None):
+    if bn_weights is None:
+        layer.set_weights([conv_weights, conv_bias])
+    elif batch_norm is None:
+        layer.set_weights(list(fold_batch_norm(conv_weights, bn_weights)))
+    else:
+        layer.set_weights([conv_weights])
+        batch_norm.set_weights(bn_weights)
+
+def load_darknet_weights(model, weights_file):
+    '''loads a Darknet weights file, returns the converted arrays keyed by conv'''
+    # the header is major, minor, revision, seen (5 x int32), the rest is float32
+    data = np.memmap(weights_file, dtype=np.float32, mode='r', offset=20)
+    offset = 0
+    converted = {}
+    for key, layer, batch_norm, has_bn in _darknet_convs(model):
+        filters = layer.filters
+        size = layer.kernel_size[0]
+        in_dim = layer.input.shape[-1]  # Use layer.input.shape for input dimension
+        if not has_bn:
+            conv_bias = data[offset:offset + filters]
+            offset += filters
+            converted[key + '/bias'] = conv_bias
+        else:
+            # darknet [beta, gamma, mean, variance] -> tf [gamma, beta, mean, variance]
+            bn_weights = data[offset:offset + 4 * filters].reshape((4, filters))[[1, 0, 2, 3]]
+            offset += 4 * filters
+            converted[key + '/bn'] = bn_weights
+
+        conv_shape = (filters, in_dim, size, size)
+        count = int(np.prod(conv_shape))
+        # zero-copy view into the mapped file, only set_weights copies it
+        conv_weights = data[offset:offset + count].reshape(conv_shape).transpose([2, 3, 1, 0])
+        offset += count
+        converted[key + '/kernel'] = conv_weights
+
+        if not has_bn:
+            _set_conv_weights(layer, None, conv_weights, conv_bias=conv_bias)
+        else:
+            _set_conv_weights(layer, batch_norm, conv_weights, bn_weights=bn_weights)
+
+    assert offset == len(data), 'failed to read all data'
+    return converted
+
+def _weights_key(path):
+    '''sha1 of the weights file path, size and mtime, a stat instead of reading 240 MB'''
+    st = os.stat(path)
+    key = '{}\0{}\0{}'.format(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def load_darknet_weights_cached(model, weights_file, cache_dir=None):
+    '''like load_darknet_weights, but keeps the converted (already transposed)
+    arrays in cache_dir as one .npy per array, keyed by the weights file path,
+    size and mtime. Later starts memory-map them, so only set_weights copies
+    the data'''
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(weights_file)), '.yolo_cache')
+    cache_path = os.path.join(cache_dir, _weights_key(weights_file))
+
+    def cached(key):
+        return np.load(os.path.join(cache_path, key.replace('/', '_') + '.npy'), mmap_mode='r')
+
+    if os.path.isdir(cache_path):
+        for key, layer, batch_norm, has_bn in _darknet_convs(model):
+            if not has_bn:
+                _set_conv_weights(layer, None, cached(key + '/kernel'), conv_bias=cached(key + '/bias'))
             else:
-                layer.set_weights([conv_weights])
-                batch_norm.set_weights(bn_weights)
-    
-    assert len(wf.read()) == 0, 'failed to read all data'
-    wf.close()
+                _set_conv_weights(layer, batch_norm, cached(key + '/kernel'), bn_weights=cached(key + '/bn'))
+        return cache_path
+
+    converted = load_darknet_weights(model, weights_file)
+    tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+    os.makedirs(tmp_path, exist_ok=True)
+    for key, array in converted.items():
+        np.save(os.path.join(tmp_path, key.replace('/', '_') + '.npy'), array)
+    try:
+        os.rename(tmp_path, cache_path)  # never leave a half written cache behind
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)  # another process got there first
+    return cache_path
+
+def fold_yolo_batch_norm(model, fused_model):
+    '''copies the weights of a YoloV3 into a YoloV3(fused=True) of the same config,
+    e.g. after training, folding every batch norm into its conv'''
+    for (_, layer, batch_norm, has_bn), (_, fused_layer, _, _) in zip(
+            _darknet_convs(model), _darknet_convs(fused_model)):
+        if not has_bn:
+            fused_layer.set_weights(layer.get_weights())
+        else:
+            fused_layer.set_weights(list(fold_batch_norm(
+                layer.get_weights()[0], batch_norm.get_weights(), batch_norm.epsilon)))
+
+def xla_forward(model):
+    '''XLA compiled forward pass. Use it on a training=True (headless) model,
+    combined_non_max_suppression in yolo_nms can not be compiled'''
+    return tf.function(lambda x: model(x, training=False), jit_compile=True)
 
 def broadcast_iou(box_1, box_2):
    
@@ -123,6 +213,26 @@ def transform_images(x_train, size):
     x_train = x_train / 255
     return x_train 
 
+def letterbox_image(img, size, fill=128):
+    '''resizes an HxWxC image to fit size x size keeping its aspect ratio and pads
+    the rest with fill. Returns (image, scale, (pad_x, pad_y)) for unletterbox_boxes'''
+    h, w = img.shape[:2]
+    scale = min(size / w, size / h)
+    new_w, new_h = max(1, round(w * scale)), max(1, round(h * scale))
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+    out = np.full((size, size) + img.shape[2:], fill, img.dtype)
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    out[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(img, (new_w, new_h), interpolation=interpolation)
+    return out, scale, (pad_x, pad_y)
+
+def unletterbox_boxes(boxes, size, scale, pad, image_shape):
+    '''normalized (x1, y1, x2, y2) boxes predicted on a letterboxed input ->
+    pixel boxes on the original image of shape image_shape'''
+    boxes = np.asarray(boxes, np.float32) * size
+    boxes = (boxes - [pad[0], pad[1], pad[0], pad[1]]) / scale
+    h, w = image_shape[:2]
+    return np.clip(boxes, 0, [w, h, w, h])
+
 @tf.function
 def transform_targets_for_output(y_true, grid_size, anchor_idxs, classes):
     N = tf.shape(y_true)[0]
@@ -168,7 +278,60 @@ def transform_targets(y_train, anchors, anchor_masks, classes):
         y_outs.append(transform_targets_for_output(
             y_train, grid_size, anchor_idxs, classes))
         grid_size *= 2
-    return tuple(y_outs)   
+    return tuple(y_outs)
+
+def transform_targets_batched(y_train, anchors, anchor_masks, size=416):
+    '''same targets as transform_targets, but every box of the batch is assigned
+    to its anchor and grid cell for all scales at once and written with a
+    single scatter into one flat buffer that is then split per scale'''
+    anchor_masks = np.asarray(anchor_masks)
+    grid_sizes = [size // 32 * 2 ** s for s in range(len(anchor_masks))]
+    n_slots = anchor_masks.shape[1]
+    # anchor index -> (output scale, position in that scale's mask)
+    anchor_scale = np.full(len(anchors), -1, np.int32)
+    anchor_slot = np.zeros(len(anchors), np.int32)
+    for s, mask in enumerate(anchor_masks):
+        anchor_scale[mask] = s
+        anchor_slot[mask] = np.arange(len(mask))
+    # same cell step as transform_targets_for_output uses (box_xy // (1/grid_size))
+    cell = np.array([1 / g for g in grid_sizes], np.float32)
+
+    y_train = tf.cast(y_train, tf.float32)
+    N = tf.shape(y_train)[0]
+    anchors = tf.cast(anchors, tf.float32)
+    anchor_area = anchors[..., 0] * anchors[..., 1]
+    box_wh = tf.expand_dims(y_train[..., 2:4] - y_train[..., 0:2], -2)
+    box_area = box_wh[..., 0] * box_wh[..., 1]
+    intersection = tf.minimum(box_wh[..., 0], anchors[..., 0]) * tf.minimum(box_wh[..., 1], anchors[..., 1])
+    iou = intersection / (box_area + anchor_area - intersection)
+    best_anchor = tf.argmax(iou, axis=-1, output_type=tf.int32)
+
+    # padded slots have x2 == 0, anchors outside every mask are dropped
+    valid = tf.logical_and(tf.not_equal(y_train[..., 2], 0),
+                           tf.gather(anchor_scale, best_anchor) >= 0)
+    box_idx = tf.where(valid)
+    boxes = tf.gather_nd(y_train, box_idx)
+    best_anchor = tf.gather_nd(best_anchor, box_idx)
+    scale = tf.gather(anchor_scale, best_anchor)
+    slot = tf.gather(anchor_slot, best_anchor)
+    grid = tf.gather(grid_sizes, scale)
+
+    box_xy = (boxes[:, 0:2] + boxes[:, 2:4]) / 2
+    grid_xy = tf.cast(box_xy // tf.gather(cell, scale)[:, None], tf.int32)
+    # a box touching the far edge must not spill into the next row / scale
+    grid_xy = tf.minimum(grid_xy, grid[:, None] - 1)
+
+    sizes = N * tf.constant([g * g * n_slots for g in grid_sizes])
+    offsets = tf.cumsum(sizes, exclusive=True)
+    image = tf.cast(box_idx[:, 0], tf.int32)
+    flat_idx = tf.gather(offsets, scale) + \
+        ((image * grid + grid_xy[:, 1]) * grid + grid_xy[:, 0]) * n_slots + slot
+    updates = tf.concat([boxes[:, 0:4], tf.ones_like(boxes[:, 4:5]), boxes[:, 4:5]], axis=-1)
+    y_flat = tf.tensor_scatter_nd_update(
+        tf.zeros((tf.reduce_sum(sizes), 6)), flat_idx[:, None], updates)
+
+    y_outs = tf.split(y_flat, sizes, num=len(grid_sizes))
+    return tuple(tf.reshape(y, (N, g, g, n_slots, 6)) for y, g in zip(y_outs, grid_sizes))
 
 class BatchNormalization(tf.keras.layers.BatchNormalization):
     @tf.function
@@ -178,7 +341,7 @@ class BatchNormalization(tf.keras.layers.BatchNormalization):
         training = tf.logical_and(training, self.trainable)
         return super(BatchNormalization, self).call(x, training=training)
 
-def DarknetConv(x, filters, size, strides=1, batch_norm=True):
+def DarknetConv(x, filters, size, strides=1, batch_norm=True, fused=False):
     if strides == 1:
         padding = 'same'
     else:
@@ -186,55 +349,57 @@ def DarknetConv(x, filters, size, strides=1, batch_norm=True):
         padding = 'valid'
     x = Conv2D(filters=filters, kernel_size=size,
                strides=strides, padding=padding,
-               use_bias=not batch_norm, kernel_regularizer=l2(0.0005))(x)
+               use_bias=not batch_norm or fused, kernel_regularizer=l2(0.0005))(x)
     if batch_norm:
-        x = BatchNormalization()(x)
+        # fused: the batch norm is folded into the conv kernel and bias on load
+        if not fused:
+            x = BatchNormalization()(x)
         x = LeakyReLU(alpha=0.1)(x)
     return x
 
-def DarknetResidual(x, filters):
+def DarknetResidual(x, filters, fused=False):
     prev = x
-    x = DarknetConv(x, filters // 2, 1)
-    x = DarknetConv(x, filters, 3)
+    x = DarknetConv(x, filters // 2, 1, fused=fused)
+    x = DarknetConv(x, filters, 3, fused=fused)
     x = Add()([prev, x])  # Ensure addition is valid
     return x  # Return the tensor
 
-def DarknetBlock(x, filters, blocks):
-    x = DarknetConv(x, filters, 3, strides=2)
+def DarknetBlock(x, filters, blocks, fused=False):
+    x = DarknetConv(x, filters, 3, strides=2, fused=fused)
     for _ in range(blocks):
-        x = DarknetResidual(x, filters)  # Ensure residual connection
+        x = DarknetResidual(x, filters, fused=fused)  # Ensure residual connection
     return x  # Return the tensor
 
-def Darknet(name=None):
+def Darknet(name=None, fused=False):
     x = inputs = Input([None, None, 3])
-    x = DarknetConv(x, 32, 3)
-    x = DarknetBlock(x, 64, 1)
-    x = DarknetBlock(x, 128, 2)  # skip connection
-    x = x_36 = DarknetBlock(x, 256, 8)  # skip connection
-    x = x_61 = DarknetBlock(x, 512, 8)
-    x = DarknetBlock(x, 1024, 4)
+    x = DarknetConv(x, 32, 3, fused=fused)
+    x = DarknetBlock(x, 64, 1, fused=fused)
+    x = DarknetBlock(x, 128, 2, fused=fused)  # skip connection
+    x = x_36 = DarknetBlock(x, 256, 8, fused=fused)  # skip connection
+    x = x_61 = DarknetBlock(x, 512, 8, fused=fused)
+    x = DarknetBlock(x, 1024, 4, fused=fused)
     return tf.keras.Model(inputs, (x_36, x_61, x), name=name)
   
-def YoloConv(x_in, filters, name=None):
+def YoloConv(x_in, filters, name=None, fused=False):
     if isinstance(x_in, tuple):
         inputs = Input(x_in[0].shape[1:]), Input(x_in[1].shape[1:])
         x, x_skip = inputs
         # concat with skip connection
-        x = DarknetConv(x, filters, 1)
+        x = DarknetConv(x, filters, 1, fused=fused)
         x = UpSampling2D(2)(x)
         x = Concatenate()([x, x_skip])
     else:
         x = inputs = Input(x_in.shape[1:])
-    x = DarknetConv(x, filters, 1)
-    x = DarknetConv(x, filters * 2, 3)
-    x = DarknetConv(x, filters, 1)
-    x = DarknetConv(x, filters * 2, 3)
-    x = DarknetConv(x, filters, 1)
+    x = DarknetConv(x, filters, 1, fused=fused)
+    x = DarknetConv(x, filters * 2, 3, fused=fused)
+    x = DarknetConv(x, filters, 1, fused=fused)
+    x = DarknetConv(x, filters * 2, 3, fused=fused)
+    x = DarknetConv(x, filters, 1, fused=fused)
     return Model(inputs, x, name=name)(x_in)
   
-def YoloOutput(x_in, filters, anchors, classes, name=None):
+def YoloOutput(x_in, filters, anchors, classes, name=None, fused=False):
     x = inputs = Input(x_in.shape[1:])
-    x = DarknetConv(x, filters * 2, 3)
+    x = DarknetConv(x, filters * 2, 3, fused=fused)
     x = DarknetConv(x, anchors * (classes + 5), 1, batch_norm=False)
     x = Lambda(lambda x: tf.reshape(x, (-1, tf.shape(x)[1], tf.shape(x)[2], anchors, classes + 5)))(x)
     return tf.keras.Model(inputs, x, name=name)(x_in)
@@ -258,16 +423,18 @@ def yolo_boxes(pred, anchors, classes):
     bbox = tf.concat([box_x1y1, box_x2y2], axis=-1)
     return bbox, objectness, class_probs, pred_box
   
-def yolo_nms(outputs, anchors, masks, classes):
-    '''boxes, conf, type'''
+def yolo_concat(outputs):
+    '''(bbox, objectness, class_probs) of all scales flattened to (batch, candidates, ...)'''
     b, c, t = [], [], []
     for o in outputs:
         b.append(tf.reshape(o[0], (tf.shape(o[0])[0], -1, tf.shape(o[0])[-1])))
         c.append(tf.reshape(o[1], (tf.shape(o[1])[0], -1, tf.shape(o[1])[-1])))
         t.append(tf.reshape(o[2], (tf.shape(o[2])[0], -1, tf.shape(o[2])[-1])))
-    bbox = tf.concat(b, axis=1)
-    confidence = tf.concat(c, axis=1)
-    class_probs = tf.concat(t, axis=1)
+    return tf.concat(b, axis=1), tf.concat(c, axis=1), tf.concat(t, axis=1)
+
+def yolo_nms(outputs, anchors, masks, classes, max_output_size=100, iou_threshold=0.5, score_threshold=0.5):
+    '''boxes, conf, type'''
+    bbox, confidence, class_probs = yolo_concat(outputs)
     scores = confidence * class_probs
     boxes, scores, classes, valid_detections = tf.image.combined_non_max_suppression(
         boxes=tf.reshape(bbox, (tf.shape(bbox)[0], -1, 1, 4)),
@@ -275,22 +442,27 @@ def yolo_nms(outputs, anchors, masks, classes):
             scores,
             (tf.shape(scores)[0], -1, tf.shape(scores)[-1])
         ),
-        max_output_size_per_class=100,
-        max_total_size = 100,
-        iou_threshold = 0.5,
-        score_threshold = 0.5
+        max_output_size_per_class=max_output_size,
+        max_total_size = max_output_size,
+        iou_threshold = iou_threshold,
+        score_threshold = score_threshold
     )
     return boxes, scores, classes, valid_detections
   
-def YoloV3(size=None, channels=3, anchors=yolo_anchors, masks=yolo_anchor_masks, classes=80, training=False):
+def YoloV3(size=None, channels=3, anchors=yolo_anchors, masks=yolo_anchor_masks, classes=80, training=False, fused=False,
+           nms=True, max_output_size=100, iou_threshold=0.5, score_threshold=0.5):
+    '''fused=True builds the inference graph without batch norm layers, load it with
+    load_darknet_weights(_cached) or fold_yolo_batch_norm. Not for training.
+    nms=False stops before suppression and outputs yolo_concat's (bbox, objectness,
+    class_probs), for nms_stage.NMSStage'''
     x = inputs = Input([size, size, channels])
-    x_36, x_61, x = Darknet(name='yolo_darknet')(x)
-    x = YoloConv(x, 512, name='yolo_conv_0')
-    output_0 = YoloOutput(x, 512, len(masks[0]), classes, name='yolo_output_0')
-    x = YoloConv((x, x_61), 256, name='yolo_conv_1')
-    output_1 = YoloOutput(x, 256, len(masks[1]), classes, name='yolo_output_1')
-    x = YoloConv((x, x_36), 128, name='yolo_conv_2')
-    output_2 = YoloOutput(x, 128, len(masks[2]), classes, name='yolo_output_2')
+    x_36, x_61, x = Darknet(name='yolo_darknet', fused=fused)(x)
+    x = YoloConv(x, 512, name='yolo_conv_0', fused=fused)
+    output_0 = YoloOutput(x, 512, len(masks[0]), classes, name='yolo_output_0', fused=fused)
+    x = YoloConv((x, x_61), 256, name='yolo_conv_1', fused=fused)
+    output_1 = YoloOutput(x, 256, len(masks[1]), classes, name='yolo_output_1', fused=fused)
+    x = YoloConv((x, x_36), 128, name='yolo_conv_2', fused=fused)
+    output_2 = YoloOutput(x, 128, len(masks[2]), classes, name='yolo_output_2', fused=fused)
     if training:
         return Model(inputs, (output_0, output_1, output_2), name='yolov3')
     boxes_0 = Lambda(lambda x: yolo_boxes(x, anchors[masks[0]], classes),
@@ -299,11 +471,91 @@ def YoloV3(size=None, channels=3, anchors=yolo_anchors, masks=yolo_anchor_masks,
                      name='yolo_boxes_1')(output_1)
     boxes_2 = Lambda(lambda x: yolo_boxes(x, anchors[masks[2]], classes),
                      name='yolo_boxes_2')(output_2)
-    outputs = Lambda(lambda x: yolo_nms(x, anchors, masks, classes),
+    if not nms:
+        outputs = Lambda(yolo_concat, name='yolo_concat')((boxes_0[:3], boxes_1[:3], boxes_2[:3]))
+        return Model(inputs, outputs, name='yolov3')
+    outputs = Lambda(lambda x: yolo_nms(x, anchors, masks, classes, max_output_size, iou_threshold, score_threshold),
                      name='yolo_nms')((boxes_0[:3], boxes_1[:3], boxes_2[:3]))
     return Model(inputs, outputs, name='yolov3')
   
-def YoloLoss(anchors, classes=80, ignore_thresh=0.5):
+def pairwise_iou(box_1, box_2):
+    '''(n, 4) x (m, 4) -> (n, m). Broadcasts inside the arithmetic, so unlike
+    broadcast_iou no (n, m, 4) copies of the boxes are materialized'''
+    box_1 = tf.expand_dims(box_1, 1)
+    box_2 = tf.expand_dims(box_2, 0)
+    int_w = tf.maximum(tf.minimum(box_1[..., 2], box_2[..., 2]) - tf.maximum(box_1[..., 0], box_2[..., 0]), 0)
+    int_h = tf.maximum(tf.minimum(box_1[..., 3], box_2[..., 3]) - tf.maximum(box_1[..., 1], box_2[..., 1]), 0)
+    int_area = int_w * int_h
+    box_1_area = (box_1[..., 2] - box_1[..., 0]) * (box_1[..., 3] - box_1[..., 1])
+    box_2_area = (box_2[..., 2] - box_2[..., 0]) * (box_2[..., 3] - box_2[..., 1])
+    return int_area / (box_1_area + box_2_area - int_area)
+
+def per_image_best_iou(pred_box, true_box, obj_mask):
+    '''best IoU of every predicted box against the true boxes of its own image.
+    pred_box, true_box: (batch, grid, grid, anchors, 4), obj_mask: (batch, grid, grid, anchors).
+    Images are done one at a time, so memory is grid^2 * anchors * that image's boxes'''
+    def best(args):
+        pred, true, mask = args
+        true = tf.boolean_mask(tf.reshape(true, (-1, 4)), tf.reshape(mask, (-1,)) > 0)
+        iou = pairwise_iou(tf.reshape(pred, (-1, 4)), true)
+        # an image without boxes gives the lowest float, so nothing is ignored
+        return tf.reshape(tf.reduce_max(iou, axis=-1), tf.shape(pred)[:-1])
+    return tf.map_fn(best, (pred_box, true_box, obj_mask), fn_output_signature=tf.float32)
+
+def class_subset_channels(class_ids, anchors=3, classes=80):
+    '''output conv channels that belong to class_ids: per anchor a, the box and
+    objectness channels a*(classes+5)+[0..4] and the class channels a*(classes+5)+5+c'''
+    channels = []
+    for a in range(anchors):
+        base = a * (classes + 5)
+        channels.extend(base + i for i in range(5))
+        channels.extend(base + 5 + c for c in class_ids)
+    return np.array(channels)
+
+def YoloV3ClassSubset(model, class_ids, size=None, masks=yolo_anchor_masks, classes=80, fused=False, **kwargs):
+    '''YoloV3 that only predicts class_ids, built from a loaded 80 class model by
+    keeping the matching filters of the last conv in every yolo_output_*. The
+    output convs, yolo_boxes and the NMS score matrix shrink accordingly. Class
+    indices in its output are positions in class_ids. fused must match model.
+    Detections of the kept classes are the same as the full model's as long as
+    the full model does not hit max_output_size with other classes'''
+    subset = YoloV3(size=size, masks=masks, classes=len(class_ids), fused=fused, **kwargs)
+    subset.get_layer('yolo_darknet').set_weights(model.get_layer('yolo_darknet').get_weights())
+    for i, mask in enumerate(masks):
+        subset.get_layer('yolo_conv_{}'.format(i)).set_weights(model.get_layer('yolo_conv_{}'.format(i)).get_weights())
+        weights = model.get_layer('yolo_output_{}'.format(i)).get_weights()
+        # the last two arrays are the output conv's (1, 1, in, anchors * (classes + 5)) kernel and its bias
+        keep = class_subset_channels(class_ids, len(mask), classes)
+        subset.get_layer('yolo_output_{}'.format(i)).set_weights(
+            weights[:-2] + [weights[-2][..., keep], weights[-1][keep]])
+    return subset
+
+def YoloHeads(size, masks=yolo_anchor_masks, classes=80):
+    '''the part of YoloV3(training=True) after the backbone: takes the three
+    Darknet outputs (x_36, x_61, x) and returns the three output grids. Layer
+    names match YoloV3, so copy_head_weights moves weights between the two'''
+    x_36 = Input([size // 8, size // 8, 256], name='x_36')
+    x_61 = Input([size // 16, size // 16, 512], name='x_61')
+    x = inputs = Input([size // 32, size // 32, 1024], name='x')
+    x = YoloConv(x, 512, name='yolo_conv_0')
+    output_0 = YoloOutput(x, 512, len(masks[0]), classes, name='yolo_output_0')
+    x = YoloConv((x, x_61), 256, name='yolo_conv_1')
+    output_1 = YoloOutput(x, 256, len(masks[1]), classes, name='yolo_output_1')
+    x = YoloConv((x, x_36), 128, name='yolo_conv_2')
+    output_2 = YoloOutput(x, 128, len(masks[2]), classes, name='yolo_output_2')
+    return Model((x_36, x_61, inputs), (output_0, output_1, output_2), name='yolov3_heads')
+
+def copy_head_weights(source, target):
+    '''copies yolo_conv_* and yolo_output_* between YoloV3 and YoloHeads models'''
+    for i in range(3):
+        for name in ('yolo_conv_{}'.format(i), 'yolo_output_{}'.format(i)):
+            target.get_layer(name).set_weights(source.get_layer(name).get_weights())
+
+def YoloLoss(anchors, classes=80, ignore_thresh=0.5, per_image=False):
+    '''per_image=True compares each predicted box only with the true boxes of its
+    own image when building the ignore mask (per_image_best_iou). The default
+    compares it with every true box in the batch via broadcast_iou, which needs
+    batch * grid^2 * anchors * boxes in the batch * 4 floats per operand'''
     def yolo_loss(y_true, y_pred):
         # 1. transform all pred outputs
         # y_pred: (batch_size, grid, grid, anchors, (x, y, w, h, obj, ...cls))
@@ -332,9 +584,12 @@ def YoloLoss(anchors, classes=80, ignore_thresh=0.5):
         # 4. calculate all masks
         obj_mask = tf.squeeze(true_obj, -1)
         # ignore false positive when iou is over threshold
-        true_box_flat = tf.boolean_mask(true_box, tf.cast(obj_mask, tf.bool))
-        best_iou = tf.reduce_max(broadcast_iou(
-            pred_box, true_box_flat), axis=-1)
+        if per_image:
+            best_iou = per_image_best_iou(pred_box, true_box, obj_mask)
+        else:
+            true_box_flat = tf.boolean_mask(true_box, tf.cast(obj_mask, tf.bool))
+            best_iou = tf.reduce_max(broadcast_iou(
+                pred_box, true_box_flat), axis=-1)
         ignore_mask = tf.cast(best_iou < ignore_thresh, tf.float32)
         
         # 5. calculate all losses
@@ -357,26 +612,12 @@ def YoloLoss(anchors, classes=80, ignore_thresh=0.5):
         return xy_loss + wh_loss + obj_loss + class_loss
     return yolo_loss
   
-yolo = YoloV3(size=416, classes=80)
-yolo.summary()
-
-from tensorflow.keras.utils import plot_model
-
-plot_model(
-    yolo, rankdir = 'TB',
-    to_file = 'yolo_model1.png',
-    show_shapes = False,
-    show_layer_names = True,
-    expand_nested = False
-)
-
-load_darknet_weights(yolo, '/content/yolov3.weights')
 def predict(image_file, visualize = True, figsize = (16, 16)):
-    img = tf.image.decode_image(open(image_file, 'rb').read(), channels=3)
-    img = tf.expand_dims(img, 0)
+    img_raw = tf.image.decode_image(open(image_file, 'rb').read(), channels=3)
+    img = tf.expand_dims(img_raw, 0)
     img = transform_images(img, 416)
     boxes, scores, classes, nums = yolo.predict(img)
-    img = cv2.cvtColor(cv2.imread(image_file), cv2.COLOR_BGR2RGB)
+    img = np.array(img_raw)  # reuse the decoded RGB image instead of reading the file again
     img = draw_outputs(img, (boxes, scores, classes, nums), class_names)
     if visualize:
         fig, axes = plt.subplots(figsize = figsize)
@@ -390,18 +631,24 @@ import cv2
 import matplotlib.pyplot as plt
 
 # Updated prediction function with scaled bounding boxes
-def predict(image_file, visualize=True, figsize=(16, 16)):
+# log: an event_log.DetectionLog to keep the detections, stored under the image file name
+def predict(image_file, visualize=True, figsize=(16, 16), log=None):
     # Load and preprocess the image
-    img = tf.image.decode_image(open(image_file, 'rb').read(), channels=3)
-    img = tf.expand_dims(img, 0)
+    img_raw = tf.image.decode_image(open(image_file, 'rb').read(), channels=3)
+    img = tf.expand_dims(img_raw, 0)
     img = transform_images(img, 416)
     
     # Get predictions
     boxes, scores, classes, nums = yolo.predict(img)
     
-    # Convert the original image for plotting
-    img = cv2.cvtColor(cv2.imread(image_file), cv2.COLOR_BGR2RGB)
+    # Reuse the decoded RGB image for plotting
+    img = np.array(img_raw)
     img_height, img_width, _ = img.shape
+
+    if log is not None:
+        n = int(nums[0])
+        log.append(time.time(), image_file, classes[0][:n], scores[0][:n],
+                   boxes[0][:n] * [img_width, img_height, img_width, img_height])
     
     # Plotting the results with scaled boxes
     if visualize:
@@ -433,9 +680,23 @@ def predict(image_file, visualize=True, figsize=(16, 16)):
     
     return boxes, scores, classes, nums
 
-# Define the path to the image
-image_file = '/content/lamb-8287365_1280.jpg'
+if __name__ == '__main__':
+    yolo = YoloV3(size=416, classes=80)
+    yolo.summary()
+
+    from tensorflow.keras.utils import plot_model
+
+    plot_model(
+        yolo, rankdir = 'TB',
+        to_file = 'yolo_model1.png',
+        show_shapes = False,
+        show_layer_names = True,
+        expand_nested = False
+    )
 
-# Run prediction and plot
-predict(image_file)
+    load_darknet_weights_cached(yolo, '/content/yolov3.weights')
+    # Define the path to the image
+    image_file = '/content/lamb-8287365_1280.jpg'
 
+    # Run prediction and plot
+    predict(image_file)
@@ -0,0 +1,67 @@
+import threading, time
+from pipeline import LatestQueue
+from tts_cache import SpeechCache
+
+class Announcer:
+    '''speaks detections on a background thread so the frame loop never waits on audio.
+
+    Each tracked object (yolo.track id) is announced once, the first time its
+    class is off cooldown, and a class is not announced again within cooldown
+    seconds. Announced ids are forgotten after track_ttl seconds out of view.
+    If speech falls behind, older phrases are dropped in favour of the newest
+    one. Phrases are spoken one at a time through a SpeechCache, so a repeated
+    phrase is only synthesized once.'''
+    def __init__(self, rate=150, cooldown=10.0, min_conf=0.4, maxsize=2, cache_dir=None, track_ttl=30.0):
+        self.rate = rate
+        self.cache_dir = cache_dir
+        self.cooldown = cooldown
+        self.min_conf = min_conf
+        self.queue = LatestQueue(maxsize)
+        self.track_ttl = track_ttl
+        self.seen_tracks = {}  # announced track id -> time.monotonic() it was last in view
+        self.pruned_at = time.monotonic()
+        self.last_spoken = {}
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def _worker(self):
+        # the engine has to be created on the thread that runs it
+        self.speech = SpeechCache(cache_dir=self.cache_dir, rate=self.rate)
+        while True:
+            phrases = self.queue.get()
+            if phrases is None:
+                break
+            for text in phrases:
+                self.speech.speak(text)
+
+    def say(self, *phrases):
+        self.queue.put(phrases)
+
+    def announce(self, detections):
+        '''detections: a detections.Detections frame'''
+        now = time.monotonic()
+        spoken_texts = []
+        detections = detections.above(self.min_conf)
+        for track_id, class_name, confidence in zip(
+                detections.track_id.tolist(), detections.class_names, detections.confidence.tolist()):
+            # untracked boxes (no id yet) only go through the class cooldown
+            if track_id in self.seen_tracks:
+                self.seen_tracks[track_id] = now
+                continue
+            if now - self.last_spoken.get(class_name, -self.cooldown) < self.cooldown:
+                continue  # not marked seen, so it is announced once the cooldown ends
+            self.last_spoken[class_name] = now
+            if track_id >= 0:
+                self.seen_tracks[track_id] = now
+            # rounded to 5 percent so the same phrase comes back and hits the cache
+            confidence = round(confidence * 20) * 5
+            spoken_texts.append(f"{class_name} detected with {confidence} percent confidence")
+        if spoken_texts:
+            self.say(*spoken_texts)
+        if now - self.pruned_at > self.track_ttl:
+            self.seen_tracks = {t: seen for t, seen in self.seen_tracks.items() if now - seen < self.track_ttl}
+            self.pruned_at = now
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join(timeout=5.0)
@@ -1,63 +1,46 @@
-import cv2
-import pyttsx3
+import sys
 from ultralytics import YOLO
+from announcer import Announcer
+from detections import Detections
+from event_log import DetectionLog
+from mjpeg import open_source
+from pipeline import FramePipeline
+from scene_gate import SceneChangeGate
 
-# Initialize pyttsx3 engine
-engine = pyttsx3.init()
-engine.setProperty('rate', 150)  # Adjust the speaking rate
+# Speech runs on its own thread, each tracked object is announced once
+announcer = Announcer(rate=150, cooldown=10.0, cache_dir=".tts_cache")
 
 # Load the YOLO model
 yolo = YOLO('yolov8s.pt')
 
-# Load the video capture
-videoCap = cv2.VideoCapture(0)
-
-def getColours(cls_num):
-    base_colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
-    color_index = cls_num % len(base_colors)
-    increments = [(1, -2, 1), (-2, 1, -1), (1, -1, 2)]
-    color = [base_colors[color_index][i] + increments[color_index][i] * 
-    (cls_num // len(base_colors)) % 256 for i in range(3)]
-    return tuple(color)
-
-while True:
-    ret, frame = videoCap.read()
-    if not ret:
-        continue
-
-    frame = cv2.resize(frame, 1200, 850))
-
-    results = yolo.track(frame, stream=True)
-
-    spoken_texts = []  # List to store detected objects to be spoken
-
-    for result in results:
-        classes_names = result.names
-
-        for box in result.boxes:
-            if box.conf[0] > 0.4:
-                [x1, y1, x2, y2] = box.xyxy[0]
-                x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                cls = int(box.cls[0])
-                class_name = classes_names[cls]
-                colour = getColours(cls)
-                confidence = box.conf[0] * 100
-
-                cv2.rectangle(frame, (x1, y1), (x2, y2), colour, 2)
-                cv2.putText(frame, f'{class_name} {confidence:.2f}%', (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 1, colour, 2)
-                
-                spoken_texts.append(f"{class_name} detected with {confidence:.1f} percent confidence")
-    
-    # Speak detected objects
-    if spoken_texts:
-        engine.say(". ".join(spoken_texts))
-        engine.runAndWait()
-    
-    cv2.imshow('frame', frame)
-
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-
-videoCap.release()
-cv2.destroyAllWindows()
-
+# skip inference on frames where nothing changed and reuse the last boxes
+gate = SceneChangeGate(threshold=4.0, max_skip=15)
+
+# every detection is kept in detections/*.parquet, see event_log.query_detections
+events = DetectionLog('detections')
+stream_name = sys.argv[1] if len(sys.argv) > 1 else '0'
+
+@gate.wrap
+def infer(frame):
+    # persist=True keeps the tracker (and so the track ids) across frames
+    # one copy of the boxes to numpy per frame, shared by drawing, speech and logging
+    detections = Detections.from_ultralytics(yolo.track(frame, persist=True))
+    events.log_detections(detections, stream_name)
+    return detections
+
+def render(frame, detections):
+    detections.above(0.4).draw(frame, label='{name} {percent:.2f}%', label_offset=10)
+
+    # Speak newly seen objects, never blocks the frame loop
+    announcer.announce(detections)
+    return frame
+
+if __name__ == "__main__":
+    # webcam by default, or a camera index / video file / ESP32 stream url
+    source = open_source(sys.argv[1] if len(sys.argv) > 1 else 0)
+    pipeline = FramePipeline(source, infer, render, resize=(1200, 850))
+    print(pipeline.run())
+    print(gate.summary())
+    announcer.close()
+    events.close()
+    print(events.summary())
@@ -0,0 +1,103 @@
+import argparse, glob, json, multiprocessing, os, sys, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.flac', '.m4a', '.ogg')
+
+_model = None
+
+def _init_worker(backend, model_name, threads):
+    '''runs once per worker process: the model is loaded once and reused for every file'''
+    global _model
+    import torch
+    from stt_backends import load_backend
+    torch.set_num_threads(threads)
+    _model = load_backend(backend, model_name, device='cpu')
+
+def transcribe_file(audio_file, batch_size=8, language=None):
+    '''splits the file into 30 s windows and decodes them batch_size at a time.
+    Windows are cut at fixed offsets, so a word on a boundary can be split'''
+    import torch
+    import whisper
+    start = time.perf_counter()
+    audio = whisper.load_audio(audio_file)
+    n = whisper.audio.N_SAMPLES
+    windows = [audio[i:i + n] for i in range(0, max(len(audio), 1), n)]
+    options = whisper.DecodingOptions(fp16=False, language=language, without_timestamps=True)
+    texts = []
+    for i in range(0, len(windows), batch_size):
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(w)), _model.dims.n_mels)
+            for w in windows[i:i + batch_size]]).to(_model.device)
+        with torch.no_grad():
+            texts.extend(r.text.strip() for r in whisper.decode(_model, mel, options))
+    return {
+        'file': audio_file,
+        'duration_s': len(audio) / whisper.audio.SAMPLE_RATE,
+        'text': ' '.join(t for t in texts if t),
+        'windows': len(windows),
+        'elapsed_s': time.perf_counter() - start,
+    }
+
+def finished_files(output_file):
+    '''files that already have a result line, errors are retried'''
+    done = set()
+    if not os.path.exists(output_file):
+        return done
+    with open(output_file) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            if 'error' not in record:
+                done.add(record['file'])
+    return done
+
+def list_audio(path):
+    if os.path.isfile(path):
+        return [path]
+    return sorted(f for f in glob.glob(os.path.join(path, '**', '*'), recursive=True)
+                  if f.lower().endswith(AUDIO_EXTENSIONS))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Transcribe a folder of recordings to JSONL')
+    parser.add_argument('audio', help='audio file or folder')
+    parser.add_argument('--output', default='transcripts.jsonl')
+    parser.add_argument('--model', default='base')
+    parser.add_argument('--backend', default='whisper', help='whisper, deepspeed or int8')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 4))
+    parser.add_argument('--batch-size', type=int, default=8, help='30 s windows per encoder call')
+    parser.add_argument('--language', default=None)
+    args = parser.parse_args()
+
+    done = finished_files(args.output)
+    if os.path.exists(args.output) and os.path.getsize(args.output):
+        with open(args.output, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')  # don't glue the next record onto a cut off line
+    todo = [f for f in list_audio(args.audio) if f not in done]
+    print('⏳ {} files to transcribe, {} already done'.format(len(todo), len(done)))
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+
+    start = time.perf_counter()
+    audio_s = 0.0
+    with open(args.output, 'a') as out, ProcessPoolExecutor(
+            args.workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker, initargs=(args.backend, args.model, threads)) as pool:
+        futures = {pool.submit(transcribe_file, f, args.batch_size, args.language): f for f in todo}
+        for i, future in enumerate(as_completed(futures), 1):
+            try:
+                record = future.result()
+                audio_s += record['duration_s']
+            except Exception as e:
+                record = {'file': futures[future], 'error': repr(e)}
+            # one complete line per file, flushed so a crash loses at most the files in flight
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            os.fsync(out.fileno())
+            print('📝 [{}/{}] {}'.format(i, len(todo), record['file']), file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    print('✅ {} files, {:.0f}s of audio in {:.0f}s ({:.1f}x real time)'.format(
+        len(todo), audio_s, elapsed, audio_s / elapsed if elapsed else 0.0))
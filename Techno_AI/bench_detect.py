@@ -0,0 +1,205 @@
+import argparse, glob, json, os, platform, sys, time
+from collections import defaultdict
+from contextlib import contextmanager
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from YOLOtest2 import (
+    YoloV3, class_names, yolo_anchors, yolo_anchor_masks,
+    load_darknet_weights_cached, transform_images, yolo_boxes, yolo_nms, draw_outputs
+)
+
+STAGES = ['decode', 'preprocess', 'forward', 'box_decode', 'nms', 'draw']
+
+def synthetic_frames(n, width=640, height=480, seed=0):
+    '''seeded JPEG frames (noise + filled shapes), same bytes on every run'''
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(n):
+        img = rng.integers(0, 64, (height, width, 3), dtype=np.uint8)
+        for _ in range(5):
+            x, y = int(rng.integers(0, width - 100)), int(rng.integers(0, height - 100))
+            color = tuple(int(c) for c in rng.integers(0, 256, 3))
+            cv2.rectangle(img, (x, y), (x + int(rng.integers(20, 100)), y + int(rng.integers(20, 100))), color, -1)
+        frames.append(cv2.imencode('.jpg', img)[1].tobytes())
+    return frames
+
+def recorded_frames(path, n):
+    '''JPEG bytes from a folder of images or a video file, no camera needed'''
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, '*.jpg')) + glob.glob(os.path.join(path, '*.png')))
+        return [open(f, 'rb').read() for f in files[:n]]
+    frames = []
+    cap = cv2.VideoCapture(path)
+    while len(frames) < n:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.imencode('.jpg', frame)[1].tobytes())
+    cap.release()
+    return frames
+
+class StageTimer:
+    def __init__(self):
+        self.times = defaultdict(list)
+
+    @contextmanager
+    def __call__(self, stage):
+        start = time.perf_counter()
+        yield
+        self.times[stage].append((time.perf_counter() - start) * 1000)
+
+    def summary(self, skip=1):
+        # the first batch pays for tracing, it is not part of the steady state
+        out = {}
+        for stage, times in self.times.items():
+            times = np.array(times[skip:] or times)
+            out[stage] = {'median_ms': float(np.median(times)), 'p90_ms': float(np.percentile(times, 90))}
+        return out
+
+def batches(frames, batch_size, iters):
+    for i in range(iters + 1):
+        start = (i * batch_size) % len(frames)
+        yield [frames[(start + j) % len(frames)] for j in range(batch_size)]
+
+def bench_tf(frames, size, batch_size, iters, weights=None):
+    model = YoloV3(size=size, classes=len(class_names), training=True)
+    if weights:
+        load_darknet_weights_cached(model, weights)
+    forward = tf.function(lambda x: model(x, training=False))
+    decode_boxes = tf.function(lambda outputs: [
+        yolo_boxes(o, yolo_anchors[m], len(class_names))[:3] for o, m in zip(outputs, yolo_anchor_masks)])
+    nms = tf.function(lambda boxes: yolo_nms(boxes, yolo_anchors, yolo_anchor_masks, len(class_names)))
+
+    timer = StageTimer()
+    start = None
+    for batch in batches(frames, batch_size, iters):
+        if start is None and timer.times:
+            start = time.perf_counter()  # after the warm-up batch
+        with timer('decode'):
+            imgs = [cv2.imdecode(np.frombuffer(b, np.uint8), cv2.IMREAD_COLOR) for b in batch]
+        with timer('preprocess'):
+            x = np.stack([cv2.resize(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), (size, size)) for img in imgs])
+            x = transform_images(x, size)
+        with timer('forward'):
+            outputs = forward(x)
+            [o.numpy() for o in outputs]
+        with timer('box_decode'):
+            boxes = decode_boxes(outputs)
+            [b[0].numpy() for b in boxes]
+        with timer('nms'):
+            detections = [d.numpy() for d in nms(boxes)]
+        with timer('draw'):
+            for i, img in enumerate(imgs):
+                draw_outputs(img, [d[i:i + 1] for d in detections], class_names)
+    elapsed = time.perf_counter() - start
+    return timer.summary(), iters * batch_size / elapsed
+
+def bench_ultralytics(frames, model_file, size, batch_size, iters):
+    '''the YOLO_test1.py / app_sandbox.py path, stage times from result.speed'''
+    from ultralytics import YOLO
+    yolo = YOLO(model_file)
+    timer = StageTimer()
+    start = None
+    for batch in batches(frames, batch_size, iters):
+        if start is None and timer.times:
+            start = time.perf_counter()
+        with timer('decode'):
+            imgs = [cv2.imdecode(np.frombuffer(b, np.uint8), cv2.IMREAD_COLOR) for b in batch]
+        results = yolo.predict(imgs, imgsz=size, verbose=False)
+        for stage, key in (('preprocess', 'preprocess'), ('forward', 'inference'), ('nms', 'postprocess')):
+            timer.times[stage].append(sum(r.speed[key] for r in results) / len(results) * len(batch))
+        with timer('draw'):
+            for img, result in zip(imgs, results):
+                for box in result.boxes:
+                    if box.conf[0] > 0.4:
+                        x1, y1, x2, y2 = (int(v) for v in box.xyxy[0])
+                        cv2.rectangle(img, (x1, y1), (x2, y2), (255, 0, 0), 2)
+                        cv2.putText(img, f'{result.names[int(box.cls[0])]} {box.conf[0]:.2f}',
+                                    (x1, y1), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2)
+    elapsed = time.perf_counter() - start
+    return timer.summary(), iters * batch_size / elapsed
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'tensorflow': tf.__version__,
+        'opencv': cv2.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def compare(base_file, new_file, tolerance):
+    '''prints per stage deltas, returns the number of regressions'''
+    base = {(r['backend'], r['size'], r['batch']): r for r in json.load(open(base_file))['results']}
+    new = json.load(open(new_file))['results']
+    regressions = 0
+    for r in new:
+        key = (r['backend'], r['size'], r['batch'])
+        if key not in base:
+            continue
+        for stage, stats in r['stages'].items():
+            if stage not in base[key]['stages']:
+                continue
+            old_ms, new_ms = base[key]['stages'][stage]['median_ms'], stats['median_ms']
+            change = (new_ms - old_ms) / old_ms if old_ms else 0.0
+            flag = ''
+            if change > tolerance:
+                flag = 'REGRESSION'
+                regressions += 1
+            print('{:12s} {:4d} {:3d} {:12s} {:9.2f} -> {:9.2f} ms {:+7.1%} {}'.format(
+                key[0], key[1], key[2], stage, old_ms, new_ms, change, flag))
+        old_fps, new_fps = base[key]['fps'], r['fps']
+        if new_fps < old_fps * (1 - tolerance):
+            regressions += 1
+            print('{:12s} {:4d} {:3d} {:12s} {:9.2f} -> {:9.2f} fps REGRESSION'.format(
+                key[0], key[1], key[2], 'throughput', old_fps, new_fps))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-stage latency / throughput of the detection stack')
+    parser.add_argument('--frames', default=None, help='folder of images or a video file, synthetic frames if omitted')
+    parser.add_argument('--num-frames', type=int, default=32)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[320, 416])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--iters', type=int, default=10)
+    parser.add_argument('--weights', default=None, help='Darknet weights, random weights if omitted')
+    parser.add_argument('--ultralytics', default=None, help='also bench an ultralytics model, e.g. yolov8s.pt')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='compare two result files')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed slowdown before flagging')
+    args = parser.parse_args()
+
+    if args.compare:
+        n = compare(*args.compare, args.tolerance)
+        print('❌ {} regressions'.format(n) if n else '✅ no regressions')
+        sys.exit(1 if n else 0)
+
+    np.random.seed(args.seed)
+    tf.random.set_seed(args.seed)
+    if args.frames:
+        frames = recorded_frames(args.frames, args.num_frames)
+    else:
+        frames = synthetic_frames(args.num_frames, seed=args.seed)
+
+    results = []
+    for size in args.sizes:
+        for batch_size in args.batch_sizes:
+            runs = [('tf_yolov3', lambda: bench_tf(frames, size, batch_size, args.iters, args.weights))]
+            if args.ultralytics:
+                runs.append(('ultralytics', lambda: bench_ultralytics(
+                    frames, args.ultralytics, size, batch_size, args.iters)))
+            for backend, run in runs:
+                stages, fps = run()
+                results.append({'backend': backend, 'size': size, 'batch': batch_size,
+                                'stages': stages, 'fps': fps})
+                print('{:12s} {:4d} {:3d} {:7.1f} fps  '.format(backend, size, batch_size, fps) +
+                      ' '.join('{}={:.1f}ms'.format(s, stages[s]['median_ms']) for s in STAGES if s in stages))
+
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'frames': args.frames or 'synthetic',
+                   'seed': args.seed, 'iters': args.iters, 'results': results}, f, indent=2)
+    print('✅ Results written to', args.output)
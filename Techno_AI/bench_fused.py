@@ -0,0 +1,68 @@
+import argparse, time
+import numpy as np
+import tensorflow as tf
+
+from YOLOtest2 import (
+    YoloV3, class_names, load_darknet_weights_cached,
+    fold_yolo_batch_norm, xla_forward
+)
+
+def randomize_batch_norm(model, seed=0):
+    # without real weights the BN layers are identities, which would hide folding bugs
+    rng = np.random.default_rng(seed)
+    for layer in model.submodules:
+        if isinstance(layer, tf.keras.layers.BatchNormalization):
+            n = layer.gamma.shape[0]
+            layer.set_weights([
+                rng.uniform(0.5, 1.5, n), rng.normal(0, 0.1, n),
+                rng.normal(0, 0.1, n), rng.uniform(0.5, 2.0, n)])
+
+def build_pair(size, weights=None):
+    '''(unfused, fused) headless models with the same weights'''
+    model = YoloV3(size=size, classes=len(class_names), training=True)
+    fused = YoloV3(size=size, classes=len(class_names), training=True, fused=True)
+    if weights:
+        load_darknet_weights_cached(model, weights)
+        load_darknet_weights_cached(fused, weights)  # folds on load
+    else:
+        randomize_batch_norm(model)
+        fold_yolo_batch_norm(model, fused)
+    return model, fused
+
+def latency_ms(fn, x, iters):
+    fn(x)  # trace / compile
+    times = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        out = fn(x)
+        out[-1].numpy()
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='YoloV3 vs YoloV3(fused=True): accuracy and CPU latency')
+    parser.add_argument('--weights', default=None, help='Darknet yolov3.weights, random BN stats if omitted')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[320, 416, 608])
+    parser.add_argument('--iters', type=int, default=10)
+    parser.add_argument('--no-xla', action='store_true')
+    args = parser.parse_args()
+
+    x = tf.random.uniform((1, max(args.sizes), max(args.sizes), 3))
+    print('{:>5s} {:>10s} {:>10s} {:>10s} {:>10s}'.format('size', 'max_err', 'bn ms', 'fused ms', 'xla ms'))
+    for size in args.sizes:
+        model, fused = build_pair(size, args.weights)
+        img = x[:, :size, :size]
+        forward = tf.function(lambda x: model(x, training=False))
+        fused_forward = tf.function(lambda x: fused(x, training=False))
+
+        max_err = max(float(tf.reduce_max(tf.abs(a - b)))
+                      for a, b in zip(forward(img), fused_forward(img)))
+        scale = max(float(tf.reduce_max(tf.abs(a))) for a in forward(img))
+        assert max_err <= 1e-3 * max(scale, 1.0), 'fused model differs: {}'.format(max_err)
+
+        xla_ms = float('nan') if args.no_xla else latency_ms(xla_forward(fused), img, args.iters)
+        print('{:5d} {:10.2e} {:10.1f} {:10.1f} {:10.1f}'.format(
+            size, max_err,
+            latency_ms(forward, img, args.iters),
+            latency_ms(fused_forward, img, args.iters),
+            xla_ms))
@@ -0,0 +1,79 @@
+import argparse, json, resource, subprocess, sys, time
+import numpy as np
+import tensorflow as tf
+
+from YOLOtest2 import YoloLoss, transform_targets_batched, yolo_anchor_masks, yolo_anchors
+
+def synthetic_batch(batch_size, boxes_per_image, size=416, scale=2, classes=80, seed=0):
+    '''(y_true, y_pred) at one output scale, scale=2 is the 52x52 grid at 416'''
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, 0.8, (batch_size, boxes_per_image, 2))
+    wh = rng.uniform(0.02, 0.2, (batch_size, boxes_per_image, 2))
+    cls = rng.integers(0, classes, (batch_size, boxes_per_image, 1))
+    y_train = np.concatenate([xy, xy + wh, cls], -1).astype(np.float32)
+    y_true = transform_targets_batched(tf.constant(y_train), yolo_anchors, yolo_anchor_masks, size)[scale]
+    grid = y_true.shape[1]
+    y_pred = tf.Variable(rng.normal(0, 1, (batch_size, grid, grid, 3, classes + 5)).astype(np.float32))
+    return y_true, y_pred
+
+def run_one(batch_size, boxes_per_image, per_image, iters, scale=2):
+    y_true, y_pred = synthetic_batch(batch_size, boxes_per_image, scale=scale)
+    loss_fn = YoloLoss(yolo_anchors[yolo_anchor_masks[scale]], per_image=per_image)
+
+    @tf.function
+    def step():
+        with tf.GradientTape() as tape:
+            loss = tf.reduce_sum(loss_fn(y_true, y_pred))
+        return loss, tape.gradient(loss, y_pred)
+
+    gpu = bool(tf.config.list_physical_devices('GPU'))
+    loss, _ = step()  # trace
+    if gpu:
+        tf.config.experimental.reset_memory_stats('GPU:0')
+    times = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        loss, grad = step()
+        grad.numpy()
+        times.append((time.perf_counter() - start) * 1000)
+    if gpu:
+        peak_mb = tf.config.experimental.get_memory_info('GPU:0')['peak'] / 2 ** 20
+    else:
+        # the whole process, this runs in a fresh one per configuration
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {'batch_size': batch_size, 'per_image': per_image, 'loss': float(loss),
+            'step_ms': float(np.median(times)), 'peak_mb': peak_mb}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='YoloLoss ignore mask: whole batch vs per image, peak memory and step time')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[2, 4, 8, 16])
+    parser.add_argument('--boxes', type=int, default=20, help='true boxes per image')
+    parser.add_argument('--iters', type=int, default=5)
+    parser.add_argument('--output', default='bench_loss.json')
+    parser.add_argument('--one', nargs=2, metavar=('BATCH_SIZE', 'PER_IMAGE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one:
+        print(json.dumps(run_one(int(args.one[0]), args.boxes, args.one[1] == '1', args.iters)))
+        sys.exit()
+
+    results = []
+    print('52x52 scale, {} boxes per image'.format(args.boxes))
+    print('{:>6s} {:>10s} {:>10s} {:>10s} {:>12s}'.format('batch', 'mode', 'step ms', 'peak MB', 'loss'))
+    for batch_size in args.batch_sizes:
+        for per_image in (False, True):
+            # a fresh process per run, so peak memory is not carried over
+            proc = subprocess.run(
+                [sys.executable, __file__, '--one', str(batch_size), str(int(per_image)),
+                 '--boxes', str(args.boxes), '--iters', str(args.iters)],
+                capture_output=True, text=True)
+            if proc.returncode != 0:
+                print('{:6d} {:>10s} failed: {}'.format(
+                    batch_size, 'per-image' if per_image else 'batch', proc.stderr.strip().splitlines()[-1:]))
+                continue
+            r = json.loads(proc.stdout.strip().splitlines()[-1])
+            results.append(r)
+            print('{:6d} {:>10s} {:10.1f} {:10.0f} {:12.1f}'.format(
+                batch_size, 'per-image' if per_image else 'batch', r['step_ms'], r['peak_mb'], r['loss']))
+    with open(args.output, 'w') as f:
+        json.dump({'boxes_per_image': args.boxes, 'results': results}, f, indent=2)
@@ -0,0 +1,75 @@
+import argparse, glob, json, os, re, time
+import torch
+import whisper
+
+from stt_backends import BACKENDS, load_backend
+
+def normalize(text):
+    return re.sub(r"[^a-z0-9' ]+", ' ', text.lower()).split()
+
+def word_errors(reference, hypothesis):
+    '''word level Levenshtein distance'''
+    ref, hyp = normalize(reference), normalize(hypothesis)
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1], len(ref)
+
+def load_clips(clip_dir):
+    '''(name, 16 kHz float32 audio, reference text) for every clip with a .txt next to it'''
+    clips = []
+    for audio_file in sorted(glob.glob(os.path.join(clip_dir, '*.wav'))):
+        text_file = os.path.splitext(audio_file)[0] + '.txt'
+        if os.path.exists(text_file):
+            clips.append((os.path.basename(audio_file), whisper.load_audio(audio_file),
+                          open(text_file).read().strip()))
+    return clips
+
+def bench_backend(backend, model_name, clips, language='en'):
+    start = time.perf_counter()
+    model = load_backend(backend, model_name, device='cpu')
+    load_s = time.perf_counter() - start
+    model.transcribe(clips[0][1], fp16=False, language=language)  # warm up
+
+    transcribe_s = audio_s = 0.0
+    errors = words = 0
+    for name, audio, reference in clips:
+        start = time.perf_counter()
+        text = model.transcribe(audio, fp16=False, language=language)['text']
+        transcribe_s += time.perf_counter() - start
+        audio_s += len(audio) / whisper.audio.SAMPLE_RATE
+        e, n = word_errors(reference, text)
+        errors, words = errors + e, words + n
+    return {
+        'backend': backend,
+        'load_s': load_s,
+        'rtf': transcribe_s / audio_s,  # < 1 is faster than real time
+        'wer': errors / max(words, 1),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CPU real-time factor and WER per transcription backend')
+    parser.add_argument('clips', help='folder of .wav clips, each with a .txt reference transcript')
+    parser.add_argument('--model', default='base')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--output', default='bench_stt.json')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    clips = load_clips(args.clips)
+    print('{} clips, {} CPU threads'.format(len(clips), torch.get_num_threads()))
+    results = []
+    for backend in args.backends:
+        try:
+            r = bench_backend(backend, args.model, clips)
+        except ImportError as e:
+            print('{:10s} skipped ({})'.format(backend, e))
+            continue
+        results.append(r)
+        print('{backend:10s} load {load_s:6.1f}s  RTF {rtf:.3f}  WER {wer:.1%}'.format(**r))
+    with open(args.output, 'w') as f:
+        json.dump({'model': args.model, 'clips': len(clips), 'results': results}, f, indent=2)
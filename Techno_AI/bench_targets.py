@@ -0,0 +1,54 @@
+import argparse, time
+import numpy as np
+import tensorflow as tf
+
+from YOLOtest2 import (
+    yolo_anchors, yolo_anchor_masks,
+    transform_targets, transform_targets_batched
+)
+
+# Random VOC-like targets: (batch, max_boxes, (x1, y1, x2, y2, cls)), with
+# trailing slots zero padded like a real dataset
+def random_targets(batch, max_boxes, fill=0.5, seed=0):
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, 0.8, (batch, max_boxes, 2))
+    wh = rng.uniform(0.01, 0.2, (batch, max_boxes, 2))
+    cls = rng.integers(0, 80, (batch, max_boxes, 1))
+    y = np.concatenate([xy, xy + wh, cls], axis=-1).astype(np.float32)
+    n_boxes = rng.integers(0, int(max_boxes * fill) + 1, batch)
+    for i, n in enumerate(n_boxes):
+        y[i, n:] = 0
+    return y, int(n_boxes.sum())
+
+def check_equivalence(y):
+    ref = transform_targets(y, yolo_anchors, yolo_anchor_masks, 80)
+    out = transform_targets_batched(y, yolo_anchors, yolo_anchor_masks)
+    for r, o in zip(ref, out):
+        np.testing.assert_array_equal(r.numpy(), o.numpy())
+
+def boxes_per_second(fn, y, n_boxes, iters):
+    fn(y)  # trace / warm up
+    start = time.perf_counter()
+    for _ in range(iters):
+        out = fn(y)
+    out[-1].numpy()
+    return n_boxes * iters / (time.perf_counter() - start)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='transform_targets vs transform_targets_batched')
+    parser.add_argument('--batch', type=int, default=16)
+    parser.add_argument('--max-boxes', type=int, default=100)
+    parser.add_argument('--iters', type=int, default=20)
+    args = parser.parse_args()
+
+    for seed in range(5):
+        check_equivalence(random_targets(args.batch, args.max_boxes, seed=seed)[0])
+    print('✅ transform_targets_batched matches transform_targets')
+
+    y, n_boxes = random_targets(args.batch, args.max_boxes)
+    y = tf.constant(y)
+    loop = lambda y: transform_targets(y, yolo_anchors, yolo_anchor_masks, 80)
+    batched = tf.function(lambda y: transform_targets_batched(y, yolo_anchors, yolo_anchor_masks))
+    for name, fn in (('loop', loop), ('batched', batched)):
+        rate = boxes_per_second(fn, y, n_boxes, args.iters)
+        print('{:8s} {:12.0f} boxes/s'.format(name, rate))
@@ -0,0 +1,96 @@
+import cv2
+import numpy as np
+
+def colour_palette(n=256):
+    '''(n, 3) colours of the old per box getColours(cls), computed once for every class id'''
+    cls = np.arange(n)[:, None]
+    base_colors = np.array([(255, 0, 0), (0, 255, 0), (0, 0, 255)])
+    increments = np.array([(1, -2, 1), (-2, 1, -1), (1, -1, 2)])
+    colours = base_colors[cls[:, 0] % 3] + np.mod(increments[cls[:, 0] % 3] * (cls // 3), 256)
+    return np.clip(colours, 0, 255).astype(np.int32)
+
+PALETTE = colour_palette()
+
+_name_tables = {}
+
+def name_table(names):
+    '''result.names ({id: name}) as an array indexed by class id, built once per names dict'''
+    entry = _name_tables.get(id(names))
+    if entry is None or entry[0] is not names:
+        table = np.array([names[i] for i in range(max(names) + 1)] if isinstance(names, dict) else list(names), dtype=object)
+        entry = _name_tables[id(names)] = (names, table)
+    return entry[1]
+
+class Detections:
+    '''one frame of detections as contiguous numpy arrays.
+
+    xyxy (n, 4) float32 pixels, confidence (n,) float32, class_id (n,) int32,
+    track_id (n,) int32 with -1 for untracked boxes. Built with a single
+    device to host copy per frame by from_ultralytics, then filtered, named,
+    coloured, drawn, spoken and logged without touching tensors again'''
+    def __init__(self, xyxy, confidence, class_id, track_id=None, names=None):
+        self.xyxy = np.asarray(xyxy, np.float32).reshape(-1, 4)
+        self.confidence = np.asarray(confidence, np.float32)
+        self.class_id = np.asarray(class_id, np.int32)
+        self.track_id = np.full(len(self.class_id), -1, np.int32) if track_id is None else np.asarray(track_id, np.int32)
+        self.names = names
+
+    @classmethod
+    def empty(cls, names=None):
+        return cls(np.zeros((0, 4)), np.zeros(0), np.zeros(0), names=names)
+
+    @classmethod
+    def from_ultralytics(cls, results):
+        '''from ultralytics predict/track results (a list or one Results)'''
+        if not isinstance(results, (list, tuple)):
+            results = [results]
+        parts, names = [], None
+        for result in results:
+            names = result.names
+            if result.boxes is None or len(result.boxes) == 0:
+                continue
+            # rows are x1 y1 x2 y2 [track id] conf cls, one copy for the whole frame
+            data = result.boxes.data.cpu().numpy()
+            track_id = data[:, 4] if data.shape[1] == 7 else None
+            parts.append(cls(data[:, :4], data[:, -2], data[:, -1], track_id, names))
+        if not parts:
+            return cls.empty(names)
+        if len(parts) == 1:
+            return parts[0]
+        return cls(np.concatenate([p.xyxy for p in parts]), np.concatenate([p.confidence for p in parts]),
+                   np.concatenate([p.class_id for p in parts]), np.concatenate([p.track_id for p in parts]), names)
+
+    def __len__(self):
+        return len(self.class_id)
+
+    def __getitem__(self, index):
+        '''boolean mask, index array or slice -> Detections'''
+        return Detections(self.xyxy[index], self.confidence[index], self.class_id[index],
+                          self.track_id[index], self.names)
+
+    def above(self, min_conf):
+        return self[self.confidence > min_conf]
+
+    @property
+    def class_names(self):
+        if self.names is None:
+            raise ValueError('these detections have no class names')
+        return name_table(self.names)[self.class_id]
+
+    @property
+    def colours(self):
+        return PALETTE[self.class_id % len(PALETTE)]
+
+    def draw(self, frame, label='{name} {confidence:.2f}', label_offset=0, font_scale=1, thickness=2):
+        '''boxes and labels on frame in place. label can use {name}, {confidence} and {percent}'''
+        if not len(self):
+            return frame
+        boxes = self.xyxy.astype(np.int32).tolist()
+        colours = self.colours.tolist()
+        confidences = self.confidence.tolist()
+        for (x1, y1, x2, y2), colour, name, confidence in zip(boxes, colours, self.class_names, confidences):
+            colour = tuple(colour)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), colour, thickness)
+            text = label.format(name=name, confidence=confidence, percent=confidence * 100)
+            cv2.putText(frame, text, (x1, y1 - label_offset), cv2.FONT_HERSHEY_SIMPLEX, font_scale, colour, thickness)
+        return frame
@@ -0,0 +1,221 @@
+import glob, os, queue, re, threading, time
+import numpy as np
+import pandas as pd
+
+from detections import Detections
+
+COLUMNS = {
+    'timestamp': np.float64,  # time.time() of the frame
+    'stream': np.int16,  # index into DetectionLog.streams, stored as a category
+    'track_id': np.int32,  # -1 when the detector does not track
+    'class_id': np.int16,
+    'confidence': np.float32,
+    'x1': np.float32, 'y1': np.float32, 'x2': np.float32, 'y2': np.float32,  # pixels
+}
+
+# detections_<first us>_<last us>_<pid>_<seq>.<ext>, the time range lets queries skip files
+FILE_PATTERN = re.compile(r'detections_(\d+)_(\d+)_\d+_\d+\.(parquet|feather)$')
+
+class _Chunk:
+    def __init__(self, size):
+        self.columns = {name: np.empty(size, dtype) for name, dtype in COLUMNS.items()}
+        self.size = size
+        self.n = 0
+
+class DetectionLog:
+    '''append-only detection store.
+
+    append() copies one frame of detections into preallocated column arrays,
+    which costs a few microseconds on the detection thread. Full chunks go to a
+    writer thread that saves each one as a Parquet (or Feather) file named by
+    its time range, then recycles the arrays, so memory stays at
+    max_chunks * chunk_size rows. If the writer falls that far behind, append
+    waits for it rather than dropping detections.'''
+    def __init__(self, directory='detections', chunk_size=8192, max_chunks=4, format='parquet', class_names=None):
+        if format not in ('parquet', 'feather'):
+            raise ValueError('format must be parquet or feather, got {!r}'.format(format))
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.format = format
+        self.class_names = class_names
+        self.streams = []
+        self.stream_ids = {}
+        self.free = queue.Queue()
+        for _ in range(max_chunks):
+            self.free.put(_Chunk(chunk_size))
+        self.chunk = self.free.get()
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.rows = self.files = 0
+        self.write_ms = 0.0
+        self.write_errors = self.rows_lost = 0
+        self.last_error = None
+        self.thread = threading.Thread(target=self._writer, daemon=True)
+        self.thread.start()
+
+    def _stream_id(self, stream):
+        stream = str(stream)
+        if stream not in self.stream_ids:
+            self.stream_ids[stream] = len(self.streams)
+            self.streams.append(stream)
+        return self.stream_ids[stream]
+
+    def append(self, timestamp, stream, class_ids, confidences, boxes, track_ids=None):
+        '''one frame: class_ids (n,), confidences (n,), boxes (n, 4) as x1 y1 x2 y2, track_ids (n,) or None'''
+        n = len(class_ids)
+        if n == 0:
+            return
+        boxes = np.asarray(boxes, np.float32).reshape(n, 4)
+        with self.lock:
+            stream_id = self._stream_id(stream)
+            start = 0
+            while start < n:
+                chunk = self.chunk
+                take = min(n - start, chunk.size - chunk.n)
+                rows = slice(chunk.n, chunk.n + take)
+                part = slice(start, start + take)
+                c = chunk.columns
+                c['timestamp'][rows] = timestamp
+                c['stream'][rows] = stream_id
+                c['track_id'][rows] = -1 if track_ids is None else np.asarray(track_ids)[part]
+                c['class_id'][rows] = np.asarray(class_ids)[part]
+                c['confidence'][rows] = np.asarray(confidences)[part]
+                for i, name in enumerate(('x1', 'y1', 'x2', 'y2')):
+                    c[name][rows] = boxes[part, i]
+                chunk.n += take
+                start += take
+                if chunk.n == chunk.size:
+                    self.pending.put(chunk)
+                    self.chunk = self.free.get()  # only waits if every chunk is still being written
+            self.rows += n
+
+    def log_detections(self, detections, stream='0', timestamp=None):
+        '''appends a detections.Detections frame'''
+        timestamp = time.time() if timestamp is None else timestamp
+        if self.class_names is None:
+            self.class_names = detections.names
+        self.append(timestamp, stream, detections.class_id, detections.confidence,
+                    detections.xyxy, detections.track_id)
+
+    def log_results(self, results, stream='0', timestamp=None):
+        '''appends ultralytics predict/track results'''
+        self.log_detections(Detections.from_ultralytics(results), stream, timestamp)
+
+    def _frame(self, chunk):
+        frame = pd.DataFrame({name: column[:chunk.n].copy() for name, column in chunk.columns.items()})
+        frame['stream'] = pd.Categorical.from_codes(frame['stream'], categories=list(self.streams))
+        if self.class_names is not None:
+            names = self.class_names
+            names = [names[i] for i in sorted(names)] if isinstance(names, dict) else list(names)
+            frame['class_name'] = pd.Categorical.from_codes(frame['class_id'], categories=names)
+        return frame
+
+    def _write(self, chunk):
+        start = time.perf_counter()
+        frame = self._frame(chunk)
+        first, last = frame['timestamp'].min(), frame['timestamp'].max()
+        self.seq += 1
+        name = 'detections_{}_{}_{}_{}.{}'.format(
+            int(first * 1e6), int(last * 1e6) + 1, os.getpid(), self.seq, self.format)
+        path = os.path.join(self.directory, name)
+        tmp = path + '.tmp'
+        try:
+            if self.format == 'parquet':
+                frame.to_parquet(tmp, index=False)
+            else:
+                frame.to_feather(tmp)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.files += 1
+        self.write_ms += (time.perf_counter() - start) * 1000
+
+    def _writer(self):
+        while True:
+            chunk = self.pending.get()
+            if chunk is None:
+                break
+            try:
+                self._write(chunk)
+            except Exception as e:
+                # a failed write (disk full, pyarrow error) loses this chunk only,
+                # the writer keeps going so append() and flush() never hang
+                self.write_errors += 1
+                self.rows_lost += chunk.n
+                self.last_error = repr(e)
+            finally:
+                chunk.n = 0
+                self.free.put(chunk)
+                self.pending.task_done()
+
+    def flush(self):
+        '''writes the partial chunk and waits until everything is on disk'''
+        with self.lock:
+            if self.chunk.n:
+                self.pending.put(self.chunk)
+                self.chunk = self.free.get()
+        self.pending.join()
+
+    def query(self, start=None, end=None, classes=None, streams=None, columns=None):
+        self.flush()
+        return query_detections(self.directory, start, end, classes, streams, columns)
+
+    def summary(self):
+        return {'rows': self.rows, 'files': self.files, 'write_ms': self.write_ms,
+                'write_errors': self.write_errors, 'rows_lost': self.rows_lost, 'last_error': self.last_error}
+
+    def close(self):
+        self.flush()
+        self.pending.put(None)
+        self.thread.join()
+
+def detection_files(directory, start=None, end=None):
+    '''files whose time range overlaps [start, end], from the names alone'''
+    files = []
+    for path in glob.glob(os.path.join(directory, 'detections_*')):
+        match = FILE_PATTERN.search(os.path.basename(path))
+        if not match:
+            continue
+        first, last = int(match.group(1)) / 1e6, int(match.group(2)) / 1e6
+        if (start is None or last >= start) and (end is None or first <= end):
+            files.append((first, path))
+    return [path for _, path in sorted(files)]
+
+def query_detections(directory, start=None, end=None, classes=None, streams=None, columns=None):
+    '''detections with start <= timestamp <= end, optionally only the given
+    classes (ids or names) and streams, as one DataFrame sorted by time'''
+    filters = []
+    if start is not None:
+        filters.append(('timestamp', '>=', start))
+    if end is not None:
+        filters.append(('timestamp', '<=', end))
+    if classes is not None:
+        classes = list(classes)
+        by_name = any(isinstance(c, str) for c in classes)
+        filters.append(('class_name' if by_name else 'class_id', 'in', classes))
+    if streams is not None:
+        filters.append(('stream', 'in', [str(s) for s in streams]))
+    if columns is not None:
+        # the filter columns have to be read too
+        columns = list(dict.fromkeys(list(columns) + [f[0] for f in filters]))
+
+    frames = []
+    for path in detection_files(directory, start, end):
+        if path.endswith('.parquet'):
+            # pushed down into the reader, row groups outside the filters are skipped
+            frame = pd.read_parquet(path, columns=columns, filters=filters or None)
+        else:
+            frame = pd.read_feather(path, columns=columns)
+            for column, op, value in filters:
+                values = frame[column].astype(object) if column in ('class_name', 'stream') else frame[column]
+                keep = values.isin(value) if op == 'in' else (values >= value if op == '>=' else values <= value)
+                frame = frame[keep]
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=columns or list(COLUMNS))
+    # categories differ between files, so compare them as plain strings
+    frames = [f.astype({c: object for c in ('stream', 'class_name') if c in f}) for f in frames]
+    return pd.concat(frames, ignore_index=True).sort_values('timestamp', kind='stable', ignore_index=True)
@@ -0,0 +1,139 @@
+import argparse, json, os, time
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from YOLOtest2 import (
+    YoloV3, class_names, yolo_anchors, yolo_anchor_masks,
+    load_darknet_weights_cached, yolo_boxes, yolo_nms
+)
+from yolo_batch import list_images
+
+def load_image(image_file, size):
+    img = cv2.cvtColor(cv2.imread(image_file), cv2.COLOR_BGR2RGB)
+    return cv2.resize(img, (size, size)).astype(np.float32)[None] / 255
+
+def export_int8(model, calibration_images, size, output_file):
+    '''full integer TFLite model of a headless (training=True) YoloV3, calibrated on local images'''
+    def representative_dataset():
+        for image_file in calibration_images:
+            yield [load_image(image_file, size)]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.uint8
+    converter.inference_output_type = tf.int8
+    tflite_model = converter.convert()
+    with open(output_file, 'wb') as f:
+        f.write(tflite_model)
+    return output_file
+
+class TFLiteYolo:
+    '''runs the int8 heads in TFLite, box decoding and NMS (same thresholds as
+    yolo_nms) outside the graph'''
+    def __init__(self, model_file, anchors=yolo_anchors, masks=yolo_anchor_masks, classes=80):
+        self.interpreter = tf.lite.Interpreter(model_path=model_file, num_threads=os.cpu_count())
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        # heads come back in any order, sort them coarse (13x13) to fine like YoloV3
+        self.outputs = sorted(self.interpreter.get_output_details(), key=lambda o: o['shape'][1])
+        self.anchors, self.masks, self.classes = anchors, masks, classes
+
+    def heads(self, img):
+        scale, zero_point = self.input['quantization']
+        x = np.clip(np.round(img / scale + zero_point), 0, 255).astype(np.uint8)
+        self.interpreter.set_tensor(self.input['index'], x)
+        self.interpreter.invoke()
+        heads = []
+        for o in self.outputs:
+            scale, zero_point = o['quantization']
+            heads.append((self.interpreter.get_tensor(o['index']).astype(np.float32) - zero_point) * scale)
+        return heads
+
+    def __call__(self, img):
+        return postprocess(self.heads(img), self.anchors, self.masks, self.classes)
+
+def postprocess(heads, anchors=yolo_anchors, masks=yolo_anchor_masks, classes=80):
+    boxes = [yolo_boxes(tf.constant(h), anchors[m], classes)[:3] for h, m in zip(heads, masks)]
+    return [o.numpy() for o in yolo_nms(boxes, anchors, masks, classes)]
+
+def box_iou(a, b):
+    w = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    h = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = w * h
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+def agreement(reference, detections, iou_threshold=0.5):
+    '''greedy same-class matching of one image's detections, returns (matched, n_ref, n_det)'''
+    ref_boxes, _, ref_classes, ref_n = (o[0] for o in reference)
+    boxes, _, classes, n = (o[0] for o in detections)
+    used = set()
+    matched = 0
+    for i in range(int(n)):
+        for j in range(int(ref_n)):
+            if j not in used and classes[i] == ref_classes[j] and \
+                    box_iou(boxes[i], ref_boxes[j]) >= iou_threshold:
+                used.add(j)
+                matched += 1
+                break
+    return matched, int(ref_n), int(n)
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, (time.perf_counter() - start) * 1000
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export YoloV3 to a full integer TFLite model')
+    parser.add_argument('calibration', help='folder of local images used for calibration')
+    parser.add_argument('--eval', default=None, help='folder of images to compare on, defaults to calibration')
+    parser.add_argument('--weights', default='/content/yolov3.weights')
+    parser.add_argument('--size', type=int, default=416)
+    parser.add_argument('--num-calibration', type=int, default=100)
+    parser.add_argument('--output', default='yolov3_int8.tflite')
+    parser.add_argument('--report', default='yolov3_int8_report.json')
+    args = parser.parse_args()
+
+    # headless: raw heads only, boxes and NMS run outside the TFLite graph
+    model = YoloV3(size=args.size, classes=len(class_names), training=True, fused=True)
+    load_darknet_weights_cached(model, args.weights)
+
+    calibration_images = list_images(args.calibration)[:args.num_calibration]
+    print('⏳ Calibrating on {} images...'.format(len(calibration_images)))
+    export_int8(model, calibration_images, args.size, args.output)
+    int8_yolo = TFLiteYolo(args.output, classes=len(class_names))
+
+    forward = tf.function(lambda x: model(x, training=False))
+    float_ms, int8_ms = [], []
+    matched = n_float = n_int8 = 0
+    for image_file in list_images(args.eval or args.calibration):
+        img = load_image(image_file, args.size)
+        reference, ms = timed(lambda x: postprocess([h.numpy() for h in forward(x)]), img)
+        float_ms.append(ms)
+        detections, ms = timed(int8_yolo, img)
+        int8_ms.append(ms)
+        m, r, d = agreement(reference, detections)
+        matched, n_float, n_int8 = matched + m, n_float + r, n_int8 + d
+
+    precision = matched / n_int8 if n_int8 else 1.0
+    recall = matched / n_float if n_float else 1.0
+    report = {
+        'size': args.size,
+        'images': len(float_ms),
+        # first call includes tracing, leave it out
+        'float_ms': float(np.median(float_ms[1:] or float_ms)),
+        'int8_ms': float(np.median(int8_ms[1:] or int8_ms)),
+        'float_mb': sum(w.nbytes for w in model.get_weights()) / 2 ** 20,
+        'int8_mb': os.path.getsize(args.output) / 2 ** 20,
+        'float_detections': n_float,
+        'int8_detections': n_int8,
+        'precision': precision,
+        'recall': recall,
+        'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+    }
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,51 @@
+import argparse, json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# shaped like an ip-api.com/json/ reply
+SAMPLE_FIX = {
+    'status': 'success', 'country': 'India', 'countryCode': 'IN', 'regionName': 'Delhi',
+    'city': 'New Delhi', 'lat': 28.6139, 'lon': 77.209, 'timezone': 'Asia/Kolkata',
+    'query': '127.0.0.1',
+}
+
+def make_server(fix=SAMPLE_FIX, host='127.0.0.1', port=8082, delay=0.0):
+    '''local stand-in for ip-api.com, answers every GET with fix after delay seconds.
+    server.requests counts the lookups, server.fail = True makes it answer 503'''
+    class LocationHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.server.requests += 1
+            time.sleep(delay)
+            if self.server.fail:
+                self.send_error(503)
+                return
+            body = json.dumps(fix).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), LocationHandler)
+    server.requests = 0
+    server.fail = False
+    return server
+
+def serve_in_background(fix=SAMPLE_FIX, host='127.0.0.1', port=0, delay=0.0):
+    '''starts the server on a thread, returns (server, url). port=0 picks a free port'''
+    server = make_server(fix, host, port, delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://{}:{}/json/'.format(*server.server_address)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake ip-api.com location server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8082)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds before each reply')
+    args = parser.parse_args()
+
+    server = make_server(SAMPLE_FIX, args.host, args.port, args.delay)
+    print('📍 Serving a fixed location at http://{}:{}/json/'.format(args.host, args.port))
+    server.serve_forever()
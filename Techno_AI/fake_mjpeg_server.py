@@ -0,0 +1,75 @@
+import argparse, glob, os, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# same boundary as the ESP32 CameraWebServer stream handler
+BOUNDARY = '123456789000000000000987654321'
+
+def make_server(image_dir, host='127.0.0.1', port=8081, fps=10.0, chunked=False, drop_after=None):
+    '''local stand-in for the ESP32-CAM /stream endpoint, replays a folder of JPEGs in a loop.
+    chunked sends HTTP/1.1 chunked transfer encoding like the real camera server,
+    drop_after sends that many frames per connection, then cuts it halfway
+    through the next JPEG (in the middle of a chunk when chunked), like a Wi-Fi drop'''
+    frames = [open(f, 'rb').read() for f in sorted(glob.glob(os.path.join(image_dir, '*.jpg')))]
+    if not frames:
+        raise ValueError('no .jpg files in ' + image_dir)
+
+    class StreamHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1' if chunked else 'HTTP/1.0'
+
+        def send_part(self, data):
+            if chunked:
+                data = b'%x\r\n' % len(data) + data + b'\r\n'
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path not in ('/', '/stream'):
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'multipart/x-mixed-replace;boundary=' + BOUNDARY)
+            if chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self.close_connection = True
+            i = 0
+            try:
+                while True:
+                    jpeg = frames[i % len(frames)]
+                    self.send_part('\r\n--{}\r\nContent-Type: image/jpeg\r\nContent-Length: {}\r\nX-Timestamp: {:.6f}\r\n\r\n'.format(
+                        BOUNDARY, len(jpeg), time.time()).encode())
+                    if drop_after is not None and i >= drop_after:
+                        # the chunk header promises the whole JPEG, only half of it follows
+                        self.wfile.write((b'%x\r\n' % len(jpeg) if chunked else b'') + jpeg[:len(jpeg) // 2])
+                        self.wfile.flush()
+                        return
+                    self.send_part(jpeg)
+                    self.wfile.flush()
+                    i += 1
+                    time.sleep(1.0 / fps)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), StreamHandler)
+
+def serve_in_background(image_dir, host='127.0.0.1', port=0, fps=10.0, chunked=False, drop_after=None):
+    '''starts the server on a thread, returns (server, stream url). port=0 picks a free port'''
+    server = make_server(image_dir, host, port, fps, chunked, drop_after)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://{}:{}/stream'.format(*server.server_address)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake ESP32-CAM MJPEG server')
+    parser.add_argument('images', help='folder of .jpg frames to replay')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--fps', type=float, default=10.0)
+    parser.add_argument('--chunked', action='store_true', help='HTTP/1.1 chunked transfer encoding, like the ESP32')
+    parser.add_argument('--drop-after', type=int, default=None, help='cut each connection mid-frame after this many frames')
+    args = parser.parse_args()
+
+    server = make_server(args.images, args.host, args.port, args.fps, args.chunked, args.drop_after)
+    print('📷 Streaming {} at http://{}:{}/stream'.format(args.images, args.host, args.port))
+    server.serve_forever()
@@ -0,0 +1,120 @@
+import json, os, threading, time
+
+DEFAULT_URL = 'http://ip-api.com/json/'
+
+def http_fetch(url, timeout=5.0):
+    import requests
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    fix = response.json()
+    if fix.get('status', 'success') != 'success':
+        raise RuntimeError('location lookup failed: {}'.format(fix.get('message', fix)))
+    return fix
+
+class LocationProvider:
+    '''last known location, refreshed on a background thread.
+
+    get() never waits on the network: it returns the cached fix (or None before
+    the first one) and, once the fix is older than ttl seconds, wakes the
+    refresher. Fixes are saved to cache_file so a restart begins with the last
+    one instead of None. fetch(url, timeout) returns the fix dict and can be
+    swapped out, e.g. to point at fake_geo_server'''
+    def __init__(self, url=DEFAULT_URL, ttl=600.0, cache_file='.location.json', fetch=http_fetch,
+                 timeout=5.0, retry_delay=30.0):
+        self.url = url
+        self.ttl = ttl
+        self.cache_file = cache_file
+        self.fetch = fetch
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.fix = None
+        self.fetched_at = 0.0  # time.time() of the fix, persisted with it
+        self.next_attempt = 0.0  # time.monotonic() before which no fetch is tried
+        self.fetches = self.failures = 0
+        self.last_error = None
+        self.wake = threading.Event()
+        self.ready = threading.Event()
+        self.closed = False
+        self._load()
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def _load(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file) as f:
+                saved = json.load(f)
+            self.fix, self.fetched_at = saved['fix'], saved['fetched_at']
+            self.ready.set()
+        except (ValueError, KeyError, OSError):
+            pass  # a broken cache file only costs a fetch
+
+    def _save(self):
+        if not self.cache_file:
+            return
+        tmp = '{}.{}.tmp'.format(self.cache_file, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump({'fix': self.fix, 'fetched_at': self.fetched_at}, f)
+        os.replace(tmp, self.cache_file)
+
+    def age(self):
+        return time.time() - self.fetched_at if self.fix is not None else float('inf')
+
+    def stale(self):
+        return self.age() > self.ttl
+
+    def _worker(self):
+        while not self.closed:
+            if self.stale() and time.monotonic() >= self.next_attempt:
+                self.fetches += 1
+                try:
+                    fix = self.fetch(self.url, self.timeout)
+                except Exception as e:
+                    self.failures += 1
+                    self.last_error = repr(e)
+                    self.next_attempt = time.monotonic() + self.retry_delay
+                else:
+                    self.fix, self.fetched_at = fix, time.time()
+                    self.next_attempt = 0.0
+                    self.last_error = None
+                    self.ready.set()
+                    try:
+                        self._save()
+                    except OSError as e:
+                        self.last_error = repr(e)
+            # sleep until the fix expires or the retry back-off ends,
+            # get() (once allowed), refresh() or close() cut this short
+            if self.stale():
+                timeout = max(0.0, self.next_attempt - time.monotonic())
+            else:
+                timeout = max(0.0, self.ttl - self.age())
+            self.wake.wait(timeout)
+            self.wake.clear()
+
+    def get(self):
+        '''the cached fix (may be older than ttl) or None, never blocks. A stale
+        fix wakes the refresher, but not while it is backing off after a failure'''
+        if self.stale() and time.monotonic() >= self.next_attempt:
+            self.wake.set()
+        return self.fix
+
+    def wait(self, timeout=None):
+        '''blocks until there is a fix, for scripts that can't do anything without one'''
+        self.ready.wait(timeout)
+        return self.get()
+
+    def refresh(self):
+        '''drops the TTL so the next background pass fetches a new fix'''
+        self.fetched_at = 0.0
+        self.next_attempt = 0.0  # also skips a failure back-off
+        self.wake.set()
+
+    def summary(self):
+        return {'age_s': self.age(), 'fetches': self.fetches, 'failures': self.failures,
+                'last_error': self.last_error}
+
+    def close(self):
+        self.closed = True
+        self.wake.set()
+        self.thread.join(timeout=self.timeout + 1.0)
@@ -0,0 +1,145 @@
+import http.client, re, threading, time, urllib.request
+import cv2
+import numpy as np
+
+class MJPEGParser:
+    '''splits a multipart/x-mixed-replace byte stream into JPEG payloads.
+    Parts with a Content-Length header (what the ESP32 camera server sends)
+    are cut without scanning the JPEG bytes, others end at the next boundary'''
+    def __init__(self, boundary):
+        self.boundary = b'--' + boundary.encode()
+        self.buffer = bytearray()
+        self.length = None  # length of the part being read, None while looking for headers
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        while True:
+            if self.length is None:
+                start = self.buffer.find(self.boundary)
+                if start < 0:
+                    # keep a possible partial boundary at the end
+                    del self.buffer[:max(0, len(self.buffer) - len(self.boundary))]
+                    break
+                end = self.buffer.find(b'\r\n\r\n', start)
+                if end < 0:
+                    break
+                headers = bytes(self.buffer[start:end]).decode('latin-1')
+                match = re.search(r'content-length:\s*(\d+)', headers, re.IGNORECASE)
+                self.length = int(match.group(1)) if match else -1
+                del self.buffer[:end + 4]
+            if self.length >= 0:
+                if len(self.buffer) < self.length:
+                    break
+                frames.append(bytes(self.buffer[:self.length]))
+                del self.buffer[:self.length]
+            else:
+                end = self.buffer.find(self.boundary)
+                if end < 0:
+                    break
+                frames.append(bytes(self.buffer[:end]).rstrip(b'\r\n'))
+                del self.buffer[:end]
+            self.length = None
+        return frames
+
+class MJPEGSource:
+    '''cv2.VideoCapture-like reader for an MJPEG over HTTP stream (ESP32-CAM).
+
+    A background thread reads whatever bytes have arrived (up to chunk_size, so
+    a finished JPEG is never held back waiting for more data) and keeps only the
+    newest JPEG with its arrival time. read() decodes that newest JPEG, so frames
+    the consumer was too slow for are never decoded. Dropped connections,
+    including ones cut in the middle of a chunked body, are retried with
+    exponential backoff.'''
+    def __init__(self, url, timeout=5.0, reconnect_delay=0.5, max_reconnect_delay=5.0, chunk_size=16384):
+        self.url = url
+        self.timeout = timeout
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.chunk_size = chunk_size
+        self.condition = threading.Condition()
+        self.latest = None  # (jpeg bytes, arrival time)
+        self.seq = 0
+        self.read_seq = 0
+        self.frames_received = 0
+        self.frames_decoded = 0
+        self.reconnects = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _connect(self):
+        response = urllib.request.urlopen(self.url, timeout=self.timeout)
+        content_type = response.headers.get('Content-Type', '')
+        match = re.search(r'boundary="?([^";]+)"?', content_type)
+        if match is None:
+            response.close()
+            raise IOError('not a multipart stream: ' + content_type)
+        return response, MJPEGParser(match.group(1))
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while self.running:
+            try:
+                response, parser = self._connect()
+            except (OSError, http.client.HTTPException):
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                self.reconnects += 1
+                continue
+            try:
+                while self.running:
+                    # read1 returns as soon as any data (of the current chunk) is there
+                    data = response.read1(self.chunk_size)
+                    if not data:
+                        break  # server closed the stream
+                    frames = parser.feed(data)
+                    if frames:
+                        with self.condition:
+                            self.latest = (frames[-1], time.time())
+                            self.seq += 1
+                            self.frames_received += len(frames)
+                            self.condition.notify_all()
+                        delay = self.reconnect_delay
+            except (OSError, http.client.HTTPException):
+                pass  # e.g. IncompleteRead when Wi-Fi drops mid-chunk
+            finally:
+                response.close()
+            if self.running:
+                self.reconnects += 1
+                time.sleep(delay)
+
+    def read_with_timestamp(self, timeout=None):
+        '''(ret, frame, arrival time) of the newest frame not returned before'''
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.seq > self.read_seq or not self.running,
+                                           timeout if timeout is not None else self.timeout):
+                return False, None, None
+            if not self.running:
+                return False, None, None
+            jpeg, arrived = self.latest
+            self.read_seq = self.seq
+        frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+        self.frames_decoded += 1
+        return frame is not None, frame, arrived
+
+    def read(self):
+        ret, frame, _ = self.read_with_timestamp()
+        return ret, frame
+
+    def isOpened(self):
+        return self.running
+
+    def release(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        self.thread.join(timeout=self.timeout)
+
+def open_source(source):
+    '''camera index, video file or MJPEG http url -> something with read()/release()'''
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    if isinstance(source, str) and source.startswith(('http://', 'https://')):
+        return MJPEGSource(source)
+    return cv2.VideoCapture(source)
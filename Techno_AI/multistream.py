@@ -0,0 +1,180 @@
+import sys, threading, time
+import cv2
+
+class StreamSlot:
+    def __init__(self, name, source, budget_ms, tracker=None):
+        self.name = name
+        self.source = source
+        self.budget_ms = budget_ms
+        self.tracker = tracker
+        self.frame = None
+        self.captured = None
+        self.waiting_since = None  # when the slot last went from nothing pending to pending
+        self.seq = 0
+        self.done_seq = 0
+        self.last_seen = time.perf_counter()
+        self.frames = 0
+        self.dropped = 0
+        self.processed = 0
+        self.latency_ms = 0.0
+
+    @property
+    def pending(self):
+        return self.seq > self.done_seq
+
+class MultiStreamScheduler:
+    '''runs one detector over many camera streams.
+
+    Every source gets a capture thread that only keeps its newest frame. The
+    scheduler fires a batch with one frame per stream as soon as every live
+    stream has a new frame, or when the oldest waiting frame has used up its
+    stream's latency budget (a partial batch). A stream that has not produced a
+    frame for stall_s does not hold batches back. If more streams are ready than
+    max_batch, the ones that have waited longest go first.
+
+    detect(frames) -> one result per frame (e.g. ultralytics_detector)
+    make_tracker() -> per stream tracker, track(tracker, result, frame) -> result
+    on_result(name, frame, result, latency_ms) is called for every processed frame'''
+    def __init__(self, sources, detect, on_result, budget_ms=50, max_batch=None,
+                 make_tracker=None, track=None, stall_s=1.0):
+        budgets = budget_ms if isinstance(budget_ms, dict) else {name: budget_ms for name in sources}
+        self.slots = [StreamSlot(name, source, budgets[name], make_tracker() if make_tracker else None)
+                      for name, source in sources.items()]
+        self.detect = detect
+        self.track = track
+        self.on_result = on_result
+        self.max_batch = max_batch or len(self.slots)
+        self.stall_s = stall_s
+        self.condition = threading.Condition()
+        self.running = threading.Event()
+        self.batches = 0
+        self.partial_batches = 0
+        self.batch_frames = 0
+
+    def _capture(self, slot):
+        while self.running.is_set():
+            ret, frame = slot.source.read()
+            if not ret:
+                time.sleep(0.005)
+                continue
+            now = time.perf_counter()
+            with self.condition:
+                if slot.pending:
+                    slot.dropped += 1  # never picked up, replaced by a fresher one
+                else:
+                    # a fresher frame must not push the budget deadline back
+                    slot.waiting_since = now
+                slot.frame, slot.captured = frame, now
+                slot.seq += 1
+                slot.frames += 1
+                slot.last_seen = now
+                self.condition.notify_all()
+
+    def _next_batch(self):
+        '''blocks until a batch should fire, returns [(slot, frame, captured)]'''
+        with self.condition:
+            while self.running.is_set():
+                now = time.perf_counter()
+                ready = [s for s in self.slots if s.pending]
+                live = [s for s in self.slots if now - s.last_seen < self.stall_s]
+                if ready:
+                    deadline = min(s.waiting_since + s.budget_ms / 1000 for s in ready)
+                    full = len(ready) >= min(len(live), self.max_batch)
+                    if full or now >= deadline:
+                        ready.sort(key=lambda s: s.waiting_since)  # longest waiting first
+                        batch = [(s, s.frame, s.captured) for s in ready[:self.max_batch]]
+                        for s in ready[:self.max_batch]:
+                            s.done_seq = s.seq
+                        if not full:
+                            self.partial_batches += 1
+                        return batch
+                    self.condition.wait(deadline - now)
+                else:
+                    # give run() a chance to check stop() while nothing arrives
+                    self.condition.wait(0.1)
+                    return []
+        return []
+
+    def summary(self):
+        return {
+            'batches': self.batches,
+            'partial_batches': self.partial_batches,
+            'mean_batch': self.batch_frames / self.batches if self.batches else 0.0,
+            'streams': {s.name: {'frames': s.frames, 'processed': s.processed,
+                                 'dropped': s.dropped, 'latency_ms': s.latency_ms}
+                        for s in self.slots},
+        }
+
+    def run(self, stop=lambda: False):
+        self.running.set()
+        threads = [threading.Thread(target=self._capture, args=(slot,), daemon=True) for slot in self.slots]
+        for t in threads:
+            t.start()
+        try:
+            while not stop():
+                batch = self._next_batch()
+                if not batch:
+                    continue
+                results = self.detect([frame for _, frame, _ in batch])
+                self.batches += 1
+                self.batch_frames += len(batch)
+                for (slot, frame, captured), result in zip(batch, results):
+                    # tracker state never mixes between streams
+                    if self.track is not None:
+                        result = self.track(slot.tracker, result, frame)
+                    latency = (time.perf_counter() - captured) * 1000
+                    slot.latency_ms = 0.9 * slot.latency_ms + 0.1 * latency if slot.processed else latency
+                    slot.processed += 1
+                    self.on_result(slot.name, frame, result, latency)
+        finally:
+            self.running.clear()
+            with self.condition:
+                self.condition.notify_all()
+            for t in threads:
+                t.join(timeout=1.0)
+            for slot in self.slots:
+                slot.source.release()
+        return self.summary()
+
+def ultralytics_detector(model_file='yolov8s.pt', conf=0.25):
+    from ultralytics import YOLO
+    yolo = YOLO(model_file)
+    return lambda frames: yolo.predict(frames, conf=conf, verbose=False)
+
+def bytetrack_factory(frame_rate=30):
+    from ultralytics.trackers.byte_tracker import BYTETracker
+    from ultralytics.utils import IterableSimpleNamespace, yaml_load
+    from ultralytics.utils.checks import check_yaml
+    cfg = IterableSimpleNamespace(**yaml_load(check_yaml('bytetrack.yaml')))
+    return lambda: BYTETracker(args=cfg, frame_rate=frame_rate)
+
+def bytetrack_update(tracker, result, frame):
+    '''same as yolo.track does per frame: keep tracked boxes, with ids'''
+    import torch
+    tracks = tracker.update(result.boxes.cpu().numpy(), frame)
+    if len(tracks) == 0:
+        return result  # like ultralytics, new objects keep their untracked boxes
+    result = result[tracks[:, -1].astype(int)]
+    result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+    return result
+
+if __name__ == "__main__":
+    from mjpeg import open_source
+
+    # python multistream.py http://cam1/stream http://cam2/stream ...
+    sources = {'cam{}'.format(i): open_source(url) for i, url in enumerate(sys.argv[1:])}
+    latest = {}
+
+    def on_result(name, frame, result, latency_ms):
+        latest[name] = result.plot()
+
+    def stop():
+        for name, frame in list(latest.items()):
+            cv2.imshow(name, frame)
+        latest.clear()
+        return cv2.waitKey(1) & 0xFF == ord('q')
+
+    scheduler = MultiStreamScheduler(sources, ultralytics_detector(), on_result, budget_ms=60,
+                                     make_tracker=bytetrack_factory(), track=bytetrack_update)
+    print(scheduler.run(stop))
+    cv2.destroyAllWindows()
@@ -0,0 +1,167 @@
+import argparse, time
+import numpy as np
+import tensorflow as tf
+
+from YOLOtest2 import YoloV3, class_names, load_darknet_weights_cached, yolo_nms
+
+class NMSStage:
+    '''post-processing for YoloV3(nms=False) outputs (bbox, objectness, class_probs).
+
+    Before suppression, candidates whose objectness is below objectness_threshold
+    are dropped and only the top_k by best class score are kept. Since a score
+    is objectness * class_prob, objectness_threshold <= score_threshold never
+    drops a box that could pass. Left unset, objectness_threshold follows
+    score_threshold, also through configure(). top_k only matters if more than top_k
+    candidates clear the score threshold. class_agnostic=True suppresses
+    overlapping boxes across classes, otherwise per class like yolo_nms.
+
+    The thresholds and top_k are tf.Variables, change them with configure()
+    at runtime without retracing or rebuilding the model. last_ms / total_ms
+    time the stage on its own'''
+    def __init__(self, max_output_size=100, iou_threshold=0.5, score_threshold=0.5,
+                 objectness_threshold=None, top_k=1000, class_agnostic=False):
+        self.max_output_size = max_output_size
+        self.class_agnostic = class_agnostic
+        self.iou_threshold = tf.Variable(iou_threshold, dtype=tf.float32, trainable=False)
+        self.score_threshold = tf.Variable(score_threshold, dtype=tf.float32, trainable=False)
+        self.objectness_threshold = tf.Variable(
+            score_threshold if objectness_threshold is None else objectness_threshold,
+            dtype=tf.float32, trainable=False)
+        self.top_k = tf.Variable(top_k, dtype=tf.int32, trainable=False)
+        self.objectness_follows_score = objectness_threshold is None
+        self.calls = 0
+        self.last_ms = self.total_ms = 0.0
+        self._suppress = tf.function(self._suppress_graph)
+
+    def configure(self, **thresholds):
+        '''e.g. configure(score_threshold=0.3, iou_threshold=0.45)'''
+        for name, value in thresholds.items():
+            if name not in ('iou_threshold', 'score_threshold', 'objectness_threshold', 'top_k'):
+                raise ValueError('unknown NMS setting {!r}'.format(name))
+            getattr(self, name).assign(value)
+        if 'objectness_threshold' in thresholds:
+            self.objectness_follows_score = False
+        elif 'score_threshold' in thresholds and self.objectness_follows_score:
+            self.objectness_threshold.assign(thresholds['score_threshold'])
+
+    def _prefilter(self, bbox, confidence, class_probs):
+        # max(objectness * class_probs) == objectness * max(class_probs), so the
+        # full candidates x classes score matrix is only built for the top_k
+        objectness = confidence[..., 0]
+        best = objectness * tf.reduce_max(class_probs, axis=-1)
+        best = tf.where(objectness >= self.objectness_threshold, best, tf.zeros_like(best))
+        k = tf.minimum(self.top_k, tf.shape(best)[1])
+        best, keep = tf.math.top_k(best, k=k)  # (batch, k)
+        scores = tf.gather(confidence, keep, batch_dims=1) * tf.gather(class_probs, keep, batch_dims=1)
+        scores = tf.where(best[..., None] > 0, scores, tf.zeros_like(scores))
+        return tf.gather(bbox, keep, batch_dims=1), scores, best
+
+    def _suppress_graph(self, bbox, confidence, class_probs):
+        bbox, scores, best = self._prefilter(bbox, confidence, class_probs)
+        if not self.class_agnostic:
+            return tf.image.combined_non_max_suppression(
+                boxes=tf.expand_dims(bbox, 2),
+                scores=scores,
+                max_output_size_per_class=self.max_output_size,
+                max_total_size=self.max_output_size,
+                iou_threshold=self.iou_threshold,
+                score_threshold=self.score_threshold)
+
+        # one suppression over all classes, each box keeps its best class
+        def suppress_one(args):
+            boxes, best, scores = args
+            keep = tf.image.non_max_suppression(
+                boxes, best, self.max_output_size, self.iou_threshold, self.score_threshold)
+            valid = tf.shape(keep)[0]
+            pad = [[0, self.max_output_size - valid]]
+            classes = tf.cast(tf.argmax(tf.gather(scores, keep), axis=-1), tf.float32)
+            return (tf.pad(tf.clip_by_value(tf.gather(boxes, keep), 0.0, 1.0), pad + [[0, 0]]),
+                    tf.pad(tf.gather(best, keep), pad), tf.pad(classes, pad), valid)
+
+        return tf.map_fn(suppress_one, (bbox, best, scores), fn_output_signature=(
+            tf.TensorSpec((self.max_output_size, 4), tf.float32),
+            tf.TensorSpec((self.max_output_size,), tf.float32),
+            tf.TensorSpec((self.max_output_size,), tf.float32),
+            tf.TensorSpec((), tf.int32)))
+
+    def __call__(self, bbox, confidence, class_probs):
+        '''same (boxes, scores, classes, valid_detections) as yolo_nms'''
+        start = time.perf_counter()
+        outputs = self._suppress(bbox, confidence, class_probs)
+        outputs[-1].numpy()  # wait for the result, so the time is NMS only
+        self.last_ms = (time.perf_counter() - start) * 1000
+        self.total_ms += self.last_ms
+        self.calls += 1
+        return outputs
+
+    def summary(self):
+        return {'calls': self.calls, 'mean_ms': self.total_ms / max(self.calls, 1)}
+
+def synthetic_candidates(batch=1, size=416, classes=80, objects=20, seed=0):
+    '''yolo_concat shaped candidates where, like a trained model, almost every
+    cell has low objectness and a few clusters around objects score high'''
+    rng = np.random.default_rng(seed)
+    n = 3 * sum((size // stride) ** 2 for stride in (32, 16, 8))
+    xy = rng.random((batch, n, 2))
+    wh = rng.uniform(0.02, 0.3, (batch, n, 2))
+    confidence = 1 / (1 + np.exp(-rng.normal(-7, 2, (batch, n, 1))))
+    class_probs = 1 / (1 + np.exp(-rng.normal(-5, 2, (batch, n, classes))))
+    for b in range(batch):
+        for _ in range(objects):
+            cls, center = rng.integers(classes), rng.random(2)
+            members = rng.choice(n, 8, replace=False)
+            xy[b, members] = center + rng.normal(0, 0.005, (8, 2))
+            confidence[b, members, 0] = rng.uniform(0.6, 0.99, 8)
+            class_probs[b, members, cls] = rng.uniform(0.7, 0.99, 8)
+    bbox = np.concatenate([xy - wh / 2, xy + wh / 2], -1)
+    return tuple(tf.constant(a, tf.float32) for a in (bbox, confidence, class_probs))
+
+def median_ms(fn, iters):
+    fn()
+    times = []
+    for _ in range(iters):
+        start = time.perf_counter()
+        fn()[-1].numpy()
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='yolo_nms vs the prefiltered NMSStage')
+    parser.add_argument('--weights', default=None, help='Darknet yolov3.weights, with --image uses real model outputs')
+    parser.add_argument('--image', default=None)
+    parser.add_argument('--size', type=int, default=416)
+    parser.add_argument('--batch', type=int, default=1)
+    parser.add_argument('--top-k', type=int, default=1000)
+    parser.add_argument('--iters', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.weights and args.image:
+        from YOLOtest2 import transform_images
+        model = YoloV3(size=args.size, classes=len(class_names), nms=False)
+        load_darknet_weights_cached(model, args.weights)
+        img = tf.image.decode_image(open(args.image, 'rb').read(), channels=3)
+        x = tf.repeat(transform_images(img[None], args.size), args.batch, axis=0)
+        start = time.perf_counter()
+        candidates = model(x, training=False)
+        print('model {:.1f} ms'.format((time.perf_counter() - start) * 1000))
+    else:
+        candidates = synthetic_candidates(args.batch, args.size, len(class_names))
+    print('{} candidates, {} above objectness 0.5'.format(
+        candidates[1].shape[1], int(tf.reduce_sum(tf.cast(candidates[1] >= 0.5, tf.int32)))))
+
+    # yolo_nms takes per-scale outputs, one "scale" holding everything is the same thing
+    baseline = tf.function(lambda b, c, t: yolo_nms([(b, c, t)], None, None, len(class_names)))
+    reference = baseline(*candidates)
+    print('{:28s} {:8.2f} ms'.format('yolo_nms', median_ms(lambda: baseline(*candidates), args.iters)))
+    for agnostic in (False, True):
+        stage = NMSStage(top_k=args.top_k, class_agnostic=agnostic)
+        ms = median_ms(lambda: stage(*candidates), args.iters)
+        outputs = stage(*candidates)
+        same = 'same as yolo_nms' if agnostic is False and all(
+            np.allclose(a.numpy(), b.numpy()) for a, b in zip(outputs, reference)) else ''
+        print('{:28s} {:8.2f} ms  {} boxes {}'.format(
+            'NMSStage' + (' class-agnostic' if agnostic else ''), ms, outputs[3].numpy().tolist(), same))
+    stage.configure(score_threshold=0.3, iou_threshold=0.4)
+    stage(*candidates)
+    print('after configure(score_threshold=0.3), no retrace: {} traces'.format(
+        stage._suppress.experimental_get_tracing_count()))
@@ -0,0 +1,140 @@
+import queue, threading, time
+import cv2
+
+class LatestQueue:
+    '''bounded queue whose put never blocks: when full, the oldest item is dropped'''
+    def __init__(self, maxsize=1):
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        return self.queue.get(timeout=timeout)
+
+class StageStats:
+    def __init__(self, smoothing=0.9):
+        self.count = 0
+        self.fps = 0.0
+        self.busy_ms = 0.0
+        self.smoothing = smoothing
+        self.last = None
+
+    def tick(self, busy_ms):
+        now = time.perf_counter()
+        if self.last is not None:
+            fps = 1.0 / max(now - self.last, 1e-6)
+            self.fps = self.smoothing * self.fps + (1 - self.smoothing) * fps if self.count > 1 else fps
+        self.busy_ms = self.smoothing * self.busy_ms + (1 - self.smoothing) * busy_ms if self.count else busy_ms
+        self.last = now
+        self.count += 1
+
+class FramePipeline:
+    '''capture -> infer -> render on separate threads joined by latest-frame-wins queues.
+
+    source: anything with read() -> (ret, frame) and release(), e.g. cv2.VideoCapture
+    infer(frame) -> results, runs on its own thread
+    render(frame, results) -> frame to show, runs on the main thread (cv2.imshow)
+    Frames the detector could not keep up with are dropped, so it always sees
+    the freshest frame and latency does not grow when inference is slow.'''
+    def __init__(self, source, infer, render, resize=None, window='frame', show_stats=True):
+        self.source = source
+        self.infer = infer
+        self.render = render
+        self.resize = resize
+        self.window = window
+        self.show_stats = show_stats
+        self.frames = LatestQueue(1)
+        self.results = LatestQueue(1)
+        self.stats = {'capture': StageStats(), 'infer': StageStats(), 'render': StageStats()}
+        self.latency_ms = 0.0
+        self.running = threading.Event()
+
+    def _capture(self):
+        with_timestamp = hasattr(self.source, 'read_with_timestamp')
+        while self.running.is_set():
+            # read() blocks until the next frame, that wait is neither work nor latency
+            if with_timestamp:
+                ret, frame, arrived = self.source.read_with_timestamp()
+            else:
+                ret, frame = self.source.read()
+            start = time.perf_counter()
+            if not ret:
+                time.sleep(0.005)
+                continue
+            # an MJPEGSource knows when the frame came off the network (time.time())
+            captured = start - max(0.0, time.time() - arrived) if with_timestamp else start
+            if self.resize is not None:
+                frame = cv2.resize(frame, self.resize)
+            self.stats['capture'].tick((time.perf_counter() - start) * 1000)
+            self.frames.put((captured, frame))
+
+    def _infer(self):
+        while self.running.is_set():
+            try:
+                captured, frame = self.frames.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            start = time.perf_counter()
+            results = self.infer(frame)
+            self.stats['infer'].tick((time.perf_counter() - start) * 1000)
+            self.results.put((captured, frame, results))
+
+    def summary(self):
+        out = {stage: {'fps': s.fps, 'busy_ms': s.busy_ms, 'frames': s.count}
+               for stage, s in self.stats.items()}
+        out['capture']['dropped'] = self.frames.dropped
+        out['infer']['dropped'] = self.results.dropped
+        out['latency_ms'] = self.latency_ms
+        return out
+
+    def _draw_stats(self, frame):
+        text = 'cap {:.0f} | inf {:.1f} | show {:.1f} fps | {:.0f} ms'.format(
+            self.stats['capture'].fps, self.stats['infer'].fps,
+            self.stats['render'].fps, self.latency_ms)
+        cv2.putText(frame, text, (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+    def run(self):
+        self.running.set()
+        threads = [threading.Thread(target=self._capture, daemon=True),
+                   threading.Thread(target=self._infer, daemon=True)]
+        for t in threads:
+            t.start()
+        try:
+            while True:
+                try:
+                    captured, frame, results = self.results.get(timeout=0.1)
+                except queue.Empty:
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+                    continue
+                start = time.perf_counter()
+                frame = self.render(frame, results)
+                now = time.perf_counter()
+                self.stats['render'].tick((now - start) * 1000)
+                # end-to-end: frame read from the source -> frame on screen
+                latency = (now - captured) * 1000
+                self.latency_ms = 0.9 * self.latency_ms + 0.1 * latency if self.latency_ms else latency
+                if self.show_stats:
+                    self._draw_stats(frame)
+                cv2.imshow(self.window, frame)
+                # break the loop if 'q' is pressed
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+        finally:
+            self.running.clear()
+            for t in threads:
+                t.join(timeout=1.0)
+            self.source.release()
+            cv2.destroyAllWindows()
+        return self.summary()
@@ -0,0 +1,57 @@
+import functools
+import cv2
+
+class SceneChangeGate:
+    '''decides whether a frame is worth running the detector on.
+
+    Frames are compared as small grayscale thumbnails against the last frame the
+    detector actually ran on (not the previous frame, so slow changes still add
+    up). Below threshold (mean absolute difference, 0-255) the frame is skipped,
+    but the detector runs at least every max_skip + 1 frames.'''
+    def __init__(self, threshold=4.0, max_skip=15, size=(64, 48)):
+        self.threshold = threshold
+        self.max_skip = max_skip
+        self.size = size
+        self.reference = None
+        self.skipped = 0
+        self.frames = 0
+        self.total_skipped = 0
+        self.last_score = 0.0
+
+    def thumbnail(self, frame):
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+
+    def should_infer(self, frame):
+        small = self.thumbnail(frame)
+        self.frames += 1
+        if self.reference is not None:
+            self.last_score = cv2.mean(cv2.absdiff(small, self.reference))[0]
+            if self.last_score < self.threshold and self.skipped < self.max_skip:
+                self.skipped += 1
+                self.total_skipped += 1
+                return False
+        self.reference = small
+        self.skipped = 0
+        return True
+
+    @property
+    def skip_rate(self):
+        return self.total_skipped / self.frames if self.frames else 0.0
+
+    def summary(self):
+        return {'frames': self.frames, 'skipped': self.total_skipped, 'skip_rate': self.skip_rate}
+
+    def wrap(self, infer):
+        '''infer(frame) that returns the last results for frames the gate skips'''
+        results = None
+
+        @functools.wraps(infer)
+        def gated(frame):
+            nonlocal results
+            # the first frame always runs, it has no reference yet
+            if self.should_infer(frame):
+                results = infer(frame)
+            return results
+        return gated
@@ -0,0 +1,174 @@
+import threading, time
+import numpy as np
+import scipy.io.wavfile as wav
+
+SAMPLE_RATE = 16000  # what Whisper expects
+
+class RingBuffer:
+    '''fixed size float32 audio buffer, written by the audio callback and read by
+    the transcriber. If the reader falls more than capacity behind, the oldest
+    audio is overwritten and counted in overruns'''
+    def __init__(self, capacity):
+        self.data = np.zeros(capacity, np.float32)
+        self.capacity = capacity
+        self.written = 0  # total samples ever written
+        self.read_pos = 0  # total samples ever read
+        self.overruns = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def write(self, samples):
+        with self.condition:
+            n = len(samples)
+            if n > self.capacity:
+                samples = samples[-self.capacity:]
+                n = self.capacity
+            start = self.written % self.capacity
+            first = min(n, self.capacity - start)
+            self.data[start:start + first] = samples[:first]
+            self.data[:n - first] = samples[first:]
+            self.written += len(samples)
+            if self.written - self.read_pos > self.capacity:
+                self.overruns += self.written - self.read_pos - self.capacity
+                self.read_pos = self.written - self.capacity
+            self.condition.notify_all()
+
+    def read(self, n, timeout=None):
+        '''next n samples and their position, None once closed and drained'''
+        with self.condition:
+            self.condition.wait_for(lambda: self.written - self.read_pos >= n or self.closed, timeout)
+            if self.written - self.read_pos < n:
+                return None
+            start = self.read_pos % self.capacity
+            idx = (start + np.arange(n)) % self.capacity
+            block = self.data[idx]
+            pos = self.read_pos
+            self.read_pos += n
+            return block, pos
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+class MicrophoneSource:
+    def __init__(self, samplerate=SAMPLE_RATE, block_ms=30, buffer_s=30):
+        self.samplerate = samplerate
+        self.block = samplerate * block_ms // 1000
+        self.buffer = RingBuffer(samplerate * buffer_s)
+        self.start_time = None
+
+    def _callback(self, indata, frames, time_info, status):
+        if self.start_time is None:
+            self.start_time = time.perf_counter() - frames / self.samplerate
+        self.buffer.write(indata[:, 0])
+
+    def blocks(self):
+        '''yields (float32 block, arrival time) until the stream stops'''
+        import sounddevice as sd
+        with sd.InputStream(samplerate=self.samplerate, channels=1, dtype='float32',
+                            blocksize=self.block, callback=self._callback):
+            while True:
+                out = self.buffer.read(self.block, timeout=1.0)
+                if out is None:
+                    continue
+                block, pos = out
+                yield block, self.start_time + (pos + self.block) / self.samplerate
+
+class WavFileSource:
+    '''plays a WAV file as if it came from the microphone, realtime=False feeds it as fast as possible'''
+    def __init__(self, filename, block_ms=30, realtime=True):
+        samplerate, audio = wav.read(filename)
+        if audio.ndim > 1:
+            audio = audio.mean(axis=1)
+        if np.issubdtype(audio.dtype, np.integer):
+            audio = audio / np.iinfo(audio.dtype).max
+        audio = audio.astype(np.float32)
+        if samplerate != SAMPLE_RATE:
+            n = int(len(audio) * SAMPLE_RATE / samplerate)
+            audio = np.interp(np.linspace(0, len(audio) - 1, n), np.arange(len(audio)), audio).astype(np.float32)
+        self.audio = audio
+        self.samplerate = SAMPLE_RATE
+        self.block = SAMPLE_RATE * block_ms // 1000
+        self.realtime = realtime
+
+    def blocks(self):
+        start = time.perf_counter()
+        for pos in range(0, len(self.audio) - self.block + 1, self.block):
+            arrival = start + (pos + self.block) / self.samplerate
+            if self.realtime:
+                time.sleep(max(0.0, arrival - time.perf_counter()))
+            else:
+                arrival = time.perf_counter()
+            yield self.audio[pos:pos + self.block], arrival
+
+class EnergyVAD:
+    '''voiced if the block RMS is well above a slowly tracked noise floor'''
+    def __init__(self, threshold=0.01, ratio=3.0):
+        self.threshold = threshold
+        self.ratio = ratio
+        self.noise = threshold / ratio
+
+    def __call__(self, block):
+        rms = float(np.sqrt(np.mean(block ** 2)))
+        voiced = rms > max(self.threshold, self.noise * self.ratio)
+        if not voiced:
+            self.noise = 0.95 * self.noise + 0.05 * rms
+        return voiced
+
+def stream_transcribe(model, source, vad=None, partial_every_s=1.0, min_speech_ms=90,
+                      silence_ms=500, preroll_ms=200, max_utterance_s=30.0, **transcribe_args):
+    '''yields {'type': 'partial' | 'final', 'text', 'ttft_ms', 'audio_s'} per utterance.
+
+    Utterances are cut by the VAD (speech ends after silence_ms of silence, or at
+    max_utterance_s, Whisper's window) and go to model.transcribe as in-memory
+    float32 arrays. While someone is still talking, the audio so far is
+    transcribed every partial_every_s seconds. ttft_ms is the time from speech
+    onset to the first text of that utterance.'''
+    vad = vad or EnergyVAD()
+    transcribe_args.setdefault('fp16', False)
+    block_ms = 1000 * source.block / source.samplerate
+    preroll = []
+    utterance = []
+    voiced_run = silent_run = 0
+    onset = first_text = last_partial = None
+
+    def transcribe(audio):
+        return model.transcribe(audio, **transcribe_args)['text'].strip()
+
+    def event(kind, text, audio):
+        nonlocal first_text
+        if first_text is None and text:
+            first_text = time.perf_counter()
+        return {'type': kind, 'text': text, 'audio_s': len(audio) / source.samplerate,
+                'ttft_ms': (first_text - onset) * 1000 if first_text else None}
+
+    for block, arrival in source.blocks():
+        voiced = vad(block)
+        if not utterance:
+            preroll = (preroll + [block])[-max(1, int(preroll_ms / block_ms)):]
+            voiced_run = voiced_run + 1 if voiced else 0
+            if voiced_run * block_ms >= min_speech_ms:
+                # speech started voiced_run blocks ago
+                onset = arrival - voiced_run * block_ms / 1000
+                utterance = list(preroll)
+                silent_run = 0
+                first_text = None
+                last_partial = time.perf_counter()
+            continue
+
+        utterance.append(block)
+        silent_run = 0 if voiced else silent_run + 1
+        audio_s = len(utterance) * block_ms / 1000
+        if silent_run * block_ms >= silence_ms or audio_s >= max_utterance_s:
+            audio = np.concatenate(utterance)
+            yield event('final', transcribe(audio), audio)
+            utterance, preroll, voiced_run = [], [], 0
+        elif time.perf_counter() - last_partial >= partial_every_s:
+            audio = np.concatenate(utterance)
+            yield event('partial', transcribe(audio), audio)
+            last_partial = time.perf_counter()
+
+    if utterance:
+        audio = np.concatenate(utterance)
+        yield event('final', transcribe(audio), audio)
@@ -0,0 +1,31 @@
+import torch
+import whisper
+
+BACKENDS = ('whisper', 'deepspeed', 'int8')
+
+def load_backend(backend='whisper', model_name='base', device=None):
+    '''Whisper model for the chosen backend, all of them expose
+    transcribe(audio, **options) -> {'text': ...}
+
+    whisper    plain model
+    deepspeed  the module of deepspeed.init_inference. DeepSpeed has no kernel
+               injection policy for Whisper, so this is the plain model (on the
+               accelerator) plus DeepSpeed's startup cost, kept for comparison
+               in bench_stt
+    int8       CPU model with dynamically int8-quantized linear layers'''
+    if backend == 'whisper':
+        return whisper.load_model(model_name, device=device)
+    if backend == 'deepspeed':
+        import deepspeed
+        model = whisper.load_model(model_name, device=device)
+        engine = deepspeed.init_inference(model, dtype=torch.float32)
+        return engine.module
+    if backend == 'int8':
+        model = whisper.load_model(model_name, device='cpu')
+        # whisper's Linear only casts the weights to the input dtype, which is a
+        # no-op in float32; quantize_dynamic only swaps exact nn.Linear modules
+        for module in model.modules():
+            if isinstance(module, whisper.model.Linear):
+                module.__class__ = torch.nn.Linear
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    raise ValueError('unknown backend {!r}, expected one of {}'.format(backend, BACKENDS))
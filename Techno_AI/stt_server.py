@@ -0,0 +1,120 @@
+import argparse, json, os, queue, socket, socketserver, tempfile, threading, time
+import numpy as np
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), 'whisper_stt.sock')
+
+# Protocol: one JSON header line, then for in-memory audio header['samples']
+# float32 samples (16 kHz mono). Reply: one JSON line.
+#   {"path": "/abs/input.wav", "options": {...}}
+#   {"samples": 80000, "options": {...}} + 320000 bytes
+#   -> {"text": "...", "queue_ms": 1.2, "transcribe_ms": 812.0} or {"error": "..."}
+
+def _read_exact(sock_file, n):
+    data = sock_file.read(n)
+    if len(data) != n:
+        raise ConnectionError('short read: {} of {} bytes'.format(len(data), n))
+    return data
+
+class TranscriptionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    '''keeps one warm model; connections are handled concurrently but all
+    transcriptions go through one queue and one worker thread, since the model
+    is not thread safe'''
+    daemon_threads = True
+
+    def __init__(self, socket_path, model, max_queue=64):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.model = model
+        self.jobs = queue.Queue(max_queue)
+        self.served = 0
+        super().__init__(socket_path, TranscriptionHandler)
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def _worker(self):
+        while True:
+            audio, options, done = self.jobs.get()
+            start = time.perf_counter()
+            try:
+                done['result'] = {'text': self.model.transcribe(audio, **options)['text']}
+            except Exception as e:
+                done['result'] = {'error': repr(e)}
+            done['result']['transcribe_ms'] = (time.perf_counter() - start) * 1000
+            self.served += 1
+            done['event'].set()
+
+    def submit(self, audio, options):
+        done = {'event': threading.Event(), 'queued': time.perf_counter()}
+        self.jobs.put((audio, options, done))  # blocks when max_queue jobs are waiting
+        done['event'].wait()
+        result = done['result']
+        result['queue_ms'] = (time.perf_counter() - done['queued']) * 1000 - result['transcribe_ms']
+        return result
+
+class TranscriptionHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return  # STTClient.available() only connects
+        try:
+            header = json.loads(line)
+            options = header.get('options', {})
+            if 'samples' in header:
+                audio = np.frombuffer(_read_exact(self.rfile, 4 * header['samples']), np.float32)
+            else:
+                audio = header['path']
+            result = self.server.submit(audio, options)
+        except (ValueError, KeyError, ConnectionError) as e:
+            result = {'error': repr(e)}
+        self.wfile.write((json.dumps(result) + '\n').encode())
+
+class STTClient:
+    '''talks to a running stt_server. transcribe() returns {'text': ...} like
+    whisper's model.transcribe, so the client can stand in for the model'''
+    def __init__(self, socket_path=DEFAULT_SOCKET, timeout=300.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def available(self):
+        if not os.path.exists(self.socket_path):
+            return False
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                s.settimeout(1.0)
+                s.connect(self.socket_path)
+            return True
+        except OSError:
+            return False
+
+    def transcribe(self, audio, **options):
+        if isinstance(audio, str):
+            header, payload = {'path': os.path.abspath(audio)}, b''
+        else:
+            audio = np.ascontiguousarray(audio, np.float32)
+            header, payload = {'samples': len(audio)}, audio.tobytes()
+        header['options'] = options
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(self.timeout)
+            s.connect(self.socket_path)
+            s.sendall((json.dumps(header) + '\n').encode() + payload)
+            with s.makefile('rb') as f:
+                result = json.loads(f.readline())
+        if 'error' in result:
+            raise RuntimeError('stt_server: ' + result['error'])
+        return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Warm Whisper transcription server on a Unix socket')
+    parser.add_argument('--model', default='base')
+    parser.add_argument('--backend', default='whisper', help='whisper, deepspeed or int8')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET)
+    args = parser.parse_args()
+
+    from stt_backends import load_backend
+    print('⏳ Loading Whisper model "{}" ({})...'.format(args.model, args.backend))
+    model = load_backend(args.backend, args.model)
+    server = TranscriptionServer(args.socket, model)
+    print('✅ Listening on', args.socket)
+    try:
+        server.serve_forever()
+    finally:
+        os.unlink(args.socket)
@@ -0,0 +1,94 @@
+import hashlib, os, tempfile, threading
+from collections import OrderedDict
+import scipy.io.wavfile as wav
+
+class SpeechCache:
+    '''synthesized speech keyed by (text, voice, rate).
+
+    Clips are kept as int16 numpy arrays in an LRU bounded by max_bytes, and
+    optionally as WAV files in cache_dir so they survive restarts. A miss
+    synthesizes with pyttsx3 once, later calls play straight from memory.
+    The pyttsx3 engine is created on first use and must stay on that thread.'''
+    def __init__(self, max_bytes=32 * 1024 * 1024, cache_dir=None, voice=None, rate=150, driver=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.voice = voice
+        self.rate = rate
+        self.driver = driver
+        self.clips = OrderedDict()  # key -> (audio, samplerate)
+        self.bytes = 0
+        self.hits = self.disk_hits = self.misses = 0
+        self.engine = None
+        self.lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, text, voice=None, rate=None):
+        voice = self.voice if voice is None else voice
+        rate = self.rate if rate is None else rate
+        return hashlib.sha1('{}\0{}\0{}'.format(text, voice, rate).encode()).hexdigest()
+
+    def _synthesize(self, text, voice, rate):
+        import pyttsx3
+        if self.engine is None:
+            self.engine = pyttsx3.init(self.driver)
+        self.engine.setProperty('rate', rate)
+        if voice is not None:
+            self.engine.setProperty('voice', voice)
+        fd, tmp = tempfile.mkstemp(suffix='.wav')
+        os.close(fd)
+        try:
+            self.engine.save_to_file(text, tmp)
+            self.engine.runAndWait()
+            samplerate, audio = wav.read(tmp)
+        finally:
+            os.remove(tmp)
+        return audio, samplerate
+
+    def _remember(self, key, clip):
+        with self.lock:
+            if key in self.clips:
+                return
+            self.clips[key] = clip
+            self.bytes += clip[0].nbytes
+            while self.bytes > self.max_bytes and len(self.clips) > 1:
+                _, (old, _) = self.clips.popitem(last=False)
+                self.bytes -= old.nbytes
+
+    def get(self, text, voice=None, rate=None):
+        '''(audio, samplerate) for text, from memory, disk or a new synthesis'''
+        voice = self.voice if voice is None else voice
+        rate = self.rate if rate is None else rate
+        key = self.key(text, voice, rate)
+        with self.lock:
+            clip = self.clips.get(key)
+            if clip is not None:
+                self.clips.move_to_end(key)
+                self.hits += 1
+                return clip
+        path = os.path.join(self.cache_dir, key + '.wav') if self.cache_dir else None
+        if path and os.path.exists(path):
+            samplerate, audio = wav.read(path)
+            self.disk_hits += 1
+        else:
+            audio, samplerate = self._synthesize(text, voice, rate)
+            self.misses += 1
+            if path:
+                # write then rename, so a crash never leaves half a clip behind
+                tmp = '{}.{}.tmp'.format(path, os.getpid())
+                wav.write(tmp, samplerate, audio)
+                os.replace(tmp, path)
+        clip = (audio, samplerate)
+        self._remember(key, clip)
+        return clip
+
+    def speak(self, text, voice=None, rate=None, blocking=True):
+        import sounddevice as sd
+        audio, samplerate = self.get(text, voice, rate)
+        sd.play(audio, samplerate)
+        if blocking:
+            sd.wait()
+
+    def summary(self):
+        return {'clips': len(self.clips), 'bytes': self.bytes, 'hits': self.hits,
+                'disk_hits': self.disk_hits, 'misses': self.misses}
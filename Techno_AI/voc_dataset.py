@@ -0,0 +1,106 @@
+import os, glob
+import xml.etree.ElementTree as ET
+import numpy as np
+import tensorflow as tf
+
+from YOLOtest2 import (
+    class_names, yolo_anchors, yolo_anchor_masks,
+    transform_images, transform_targets_batched
+)
+
+def parse_voc_annotation(xml_file, class_names=class_names):
+    '''returns (image filename, boxes (n, 4) normalized x1y1x2y2, class ids (n,))'''
+    root = ET.parse(xml_file).getroot()
+    width = float(root.find('size/width').text)
+    height = float(root.find('size/height').text)
+    boxes, class_ids = [], []
+    for obj in root.iter('object'):
+        name = obj.find('name').text.strip()
+        if name not in class_names:
+            continue
+        bndbox = obj.find('bndbox')
+        boxes.append([
+            float(bndbox.find('xmin').text) / width,
+            float(bndbox.find('ymin').text) / height,
+            float(bndbox.find('xmax').text) / width,
+            float(bndbox.find('ymax').text) / height,
+        ])
+        class_ids.append(class_names.index(name))
+    return root.find('filename').text, boxes, class_ids
+
+def build_voc_index(annotations_dir, images_dir, index_file, class_names=class_names):
+    '''parses every VOC xml once and stores the boxes as one flat array with
+    per image offsets, so later runs never touch the xml again'''
+    files, boxes, class_ids, offsets = [], [], [], [0]
+    for xml_file in sorted(glob.glob(os.path.join(annotations_dir, '*.xml'))):
+        filename, b, c = parse_voc_annotation(xml_file, class_names)
+        if not b:
+            continue
+        files.append(os.path.join(images_dir, filename))
+        boxes.extend(b)
+        class_ids.extend(c)
+        offsets.append(len(boxes))
+    index = {
+        'files': np.array(files),
+        'boxes': np.array(boxes, np.float32).reshape(-1, 4),
+        'class_ids': np.array(class_ids, np.int16),
+        'offsets': np.array(offsets, np.int64),
+        'class_names': np.array(class_names),
+    }
+    tmp_file = index_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, **index)
+    os.replace(tmp_file, index_file)
+    return index
+
+def load_voc_index(annotations_dir, images_dir, index_file=None, class_names=class_names):
+    if index_file is None:
+        index_file = os.path.join(annotations_dir, 'voc_index.npz')
+    if os.path.exists(index_file):
+        with np.load(index_file) as f:
+            index = dict(f)
+        if list(index['class_names']) == list(class_names):
+            return index
+    print('⏳ Parsing VOC annotations into', index_file)
+    return build_voc_index(annotations_dir, images_dir, index_file, class_names)
+
+def pad_boxes(index, max_boxes=100):
+    '''(n_images, max_boxes, (x1, y1, x2, y2, cls)), zero padded like transform_targets expects'''
+    offsets = index['offsets']
+    y = np.zeros((len(offsets) - 1, max_boxes, 5), np.float32)
+    for i, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+        end = min(end, start + max_boxes)
+        y[i, :end - start, 0:4] = index['boxes'][start:end]
+        y[i, :end - start, 4] = index['class_ids'][start:end]
+    return y
+
+def voc_dataset(annotations_dir, images_dir, size=416, batch_size=8,
+                anchors=yolo_anchors, anchor_masks=yolo_anchor_masks,
+                index_file=None, cache_file='', max_boxes=100, shuffle=True):
+    '''(images, targets) batches for YoloV3(training=True) + YoloLoss.
+    cache_file='' caches decoded images in memory, a path caches them on disk,
+    None disables the cache'''
+    index = load_voc_index(annotations_dir, images_dir, index_file)
+    dataset = tf.data.Dataset.from_tensor_slices((index['files'], pad_boxes(index, max_boxes)))
+
+    def load_image(path, y):
+        img = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        # resize once before caching, stored as uint8 to keep the cache small
+        img = tf.cast(tf.round(tf.image.resize(img, (size, size))), tf.uint8)
+        return img, y
+
+    dataset = dataset.map(load_image, num_parallel_calls=tf.data.AUTOTUNE, deterministic=False)
+    if cache_file is not None:
+        dataset = dataset.cache(cache_file)
+    if shuffle:
+        dataset = dataset.shuffle(512)
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(lambda x, y: (
+        transform_images(tf.cast(x, tf.float32), size),
+        transform_targets_batched(y, anchors, anchor_masks, size)),
+        num_parallel_calls=tf.data.AUTOTUNE)
+
+    options = tf.data.Options()
+    options.threading.private_threadpool_size = os.cpu_count()
+    options.autotune.cpu_budget = os.cpu_count()
+    return dataset.with_options(options).prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,94 @@
+import argparse, collections, csv, glob, json, os, sys, time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+from YOLOtest2 import YoloV3, class_names, load_darknet_weights_cached
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def _decode(image_file, size):
+    # the only decode of this image; cv2 releases the GIL so threads scale
+    img = cv2.imread(image_file)
+    if img is None:
+        return image_file, None, None
+    h, w = img.shape[:2]
+    img = cv2.resize(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), (size, size))
+    return image_file, (w, h), img
+
+def predict_batch(model, image_files, size=416, batch_size=16, workers=None, prefetch=2):
+    '''yields one dict per detection, boxes in pixel coordinates of the original image.
+    Images are decoded on a thread pool a few batches ahead of the model, and every
+    model call gets a full (zero padded) batch so the graph is never retraced'''
+    image_files = iter(image_files)
+    pending = collections.deque()
+    with ThreadPoolExecutor(workers) as pool:
+        def fill():
+            while len(pending) < batch_size * (prefetch + 1):
+                image_file = next(image_files, None)
+                if image_file is None:
+                    return
+                pending.append(pool.submit(_decode, image_file, size))
+
+        fill()
+        while pending:
+            batch = [pending.popleft().result() for _ in range(min(batch_size, len(pending)))]
+            fill()
+            for image_file, _, img in batch:
+                if img is None:
+                    print('⚠️ Could not read', image_file, file=sys.stderr)
+            batch = [b for b in batch if b[2] is not None]
+            if not batch:
+                continue
+
+            x = np.zeros((batch_size, size, size, 3), np.float32)
+            x[:len(batch)] = np.stack([img for _, _, img in batch])
+            x /= 255
+            boxes, scores, classes, nums = model.predict_on_batch(x)
+            for i, (image_file, (w, h), _) in enumerate(batch):
+                for j in range(nums[i]):
+                    x1, y1, x2, y2 = boxes[i][j] * (w, h, w, h)
+                    yield {
+                        'image': image_file,
+                        'class': class_names[int(classes[i][j])],
+                        'score': round(float(scores[i][j]), 4),
+                        'x1': round(float(x1), 1), 'y1': round(float(y1), 1),
+                        'x2': round(float(x2), 1), 'y2': round(float(y2), 1),
+                    }
+
+def list_images(path):
+    if os.path.isfile(path):
+        return [path]
+    return sorted(f for f in glob.glob(os.path.join(path, '**', '*'), recursive=True)
+                  if f.lower().endswith(IMAGE_EXTENSIONS))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run YoloV3 over a folder of images')
+    parser.add_argument('images', help='image file or folder')
+    parser.add_argument('--weights', default='/content/yolov3.weights')
+    parser.add_argument('--output', default='detections.jsonl', help='.jsonl or .csv')
+    parser.add_argument('--size', type=int, default=416)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    yolo = YoloV3(size=args.size, classes=len(class_names))
+    load_darknet_weights_cached(yolo, args.weights)
+
+    image_files = list_images(args.images)
+    start = time.perf_counter()
+    with open(args.output, 'w', newline='') as f:
+        fields = ['image', 'class', 'score', 'x1', 'y1', 'x2', 'y2']
+        if args.output.endswith('.csv'):
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            write = lambda row: f.write(json.dumps(row) + '\n')
+        n_detections = 0
+        for row in predict_batch(yolo, image_files, args.size, args.batch_size, args.workers):
+            write(row)
+            n_detections += 1
+    elapsed = time.perf_counter() - start
+    print('✅ {} images, {} detections in {:.1f}s ({:.1f} images/s) -> {}'.format(
+        len(image_files), n_detections, elapsed, len(image_files) / elapsed, args.output))
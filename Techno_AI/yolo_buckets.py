@@ -0,0 +1,111 @@
+import argparse, time
+import numpy as np
+import tensorflow as tf
+
+from YOLOtest2 import (
+    YoloV3, class_names, letterbox_image, load_darknet_weights_cached,
+    transform_images, unletterbox_boxes
+)
+
+DEFAULT_BUCKETS = (320, 416, 608)
+
+class BucketedYolo:
+    '''runs a YoloV3(size=None) model on images of any resolution without retracing.
+
+    Every image is letterboxed into the smallest bucket that holds its longer
+    side (or the largest bucket), so only len(buckets) input shapes ever reach
+    the model. Each bucket has its own concrete function, traced and run once
+    in __init__, so the first real image of a new resolution pays no compile.
+    Buckets are square because yolo_boxes assumes a square grid'''
+    def __init__(self, model, buckets=DEFAULT_BUCKETS, batch_size=1, warmup=True):
+        self.buckets = tuple(sorted(buckets))
+        self.batch_size = batch_size
+        forward = tf.function(lambda x: model(tf.cast(x, tf.float32) / 255, training=False))
+        self.functions = {
+            size: forward.get_concrete_function(tf.TensorSpec((batch_size, size, size, 3), tf.uint8))
+            for size in self.buckets}
+        self.forward = forward
+        self.calls = {size: 0 for size in self.buckets}
+        if warmup:
+            for size, fn in self.functions.items():
+                fn(tf.zeros((batch_size, size, size, 3), tf.uint8))
+
+    def bucket(self, image_shape):
+        longest = max(image_shape[:2])
+        for size in self.buckets:
+            if size >= longest:
+                return size
+        return self.buckets[-1]
+
+    def traces(self):
+        '''how often the model was traced, stays at len(buckets) after __init__'''
+        return self.forward.experimental_get_tracing_count()
+
+    def predict(self, images):
+        '''RGB uint8 HxWx3 images -> one (boxes, scores, classes) per image, boxes
+        as x1 y1 x2 y2 pixels of that image. Images of the same bucket share a call'''
+        by_bucket = {}
+        for i, img in enumerate(images):
+            by_bucket.setdefault(self.bucket(img.shape), []).append(i)
+        results = [None] * len(images)
+        for size, indices in by_bucket.items():
+            for start in range(0, len(indices), self.batch_size):
+                chunk = indices[start:start + self.batch_size]
+                x = np.zeros((self.batch_size, size, size, 3), np.uint8)  # padded to a full batch
+                transforms = []
+                for j, i in enumerate(chunk):
+                    x[j], scale, pad = letterbox_image(images[i], size)
+                    transforms.append((scale, pad))
+                boxes, scores, classes, nums = (o.numpy() for o in self.functions[size](tf.constant(x)))
+                self.calls[size] += 1
+                for j, i in enumerate(chunk):
+                    n = int(nums[j])
+                    scale, pad = transforms[j]
+                    results[i] = (unletterbox_boxes(boxes[j, :n], size, scale, pad, images[i].shape),
+                                  scores[j, :n], classes[j, :n].astype(np.int32))
+        return results
+
+def mixed_images(n, seed=0):
+    # typical camera / phone / thumbnail resolutions, in a shuffled order
+    shapes = [(480, 640), (720, 1280), (1080, 1920), (300, 400), (600, 800), (640, 480), (1024, 768), (240, 320)]
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, shapes[i % len(shapes)] + (3,), dtype=np.uint8) for i in rng.permutation(n)]
+
+def timings(fn, images):
+    times = []
+    for img in images:
+        start = time.perf_counter()
+        fn(img)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Retracing per resolution vs letterboxed size buckets')
+    parser.add_argument('--weights', default=None, help='Darknet yolov3.weights, random weights if omitted')
+    parser.add_argument('--buckets', type=int, nargs='+', default=list(DEFAULT_BUCKETS))
+    parser.add_argument('--images', type=int, default=32)
+    args = parser.parse_args()
+
+    model = YoloV3(size=None, classes=len(class_names))
+    if args.weights:
+        load_darknet_weights_cached(model, args.weights)
+    images = mixed_images(args.images)
+
+    # before: transform_images at the image's own size (longer side rounded to the
+    # stride), every new resolution is a new input shape and a new trace
+    forward = tf.function(lambda x: model(x, training=False))
+    def native(img):
+        size = -(-max(img.shape[:2]) // 32) * 32
+        x = transform_images(tf.constant(img[None]), size)
+        return [o.numpy() for o in forward(x)]
+
+    start = time.perf_counter()
+    bucketed = BucketedYolo(model, args.buckets)
+    warmup_s = time.perf_counter() - start
+
+    for name, fn, traces in (('per-resolution', native, forward.experimental_get_tracing_count),
+                             ('bucketed', lambda img: bucketed.predict([img]), bucketed.traces)):
+        times = timings(fn, images)
+        print('{:15s} p50 {:7.1f} ms  p99 {:7.1f} ms  max {:7.1f} ms  traces {}'.format(
+            name, np.percentile(times, 50), np.percentile(times, 99), max(times), traces()))
+    print('bucket warm-up {:.1f}s, calls per bucket {}'.format(warmup_s, bucketed.calls))